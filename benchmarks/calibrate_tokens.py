@@ -0,0 +1,56 @@
+"""
+Calibrates the Splitter's CHARS_PER_TOKEN against the Processor's tokenizer.
+
+The Splitter sizes chunks by estimated model tokens without loading a tokenizer: it
+divides each review's length in characters by CHARS_PER_TOKEN. This script tokenizes
+reviews (synthetic ones, or a real CSV with --csv) with the model's tokenizer, prints
+the characters-per-token ratio that fits them best, and shows how far the per-chunk
+estimate is off with that ratio.
+
+Usage: python calibrate_tokens.py --model-dir /opt/model [--csv reviews.csv] [--chunk-rows 200]
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from tokenizers import Tokenizer
+
+from synthetic_reviews import LENGTH_PROFILES, generate_reviews
+
+
+def review_texts(args):
+    """Returns the texts the Processor scores: the title and the review text."""
+    df = pd.read_csv(args.csv, dtype=str) if args.csv else generate_reviews(args.rows, args.profile, args.seed)
+    df = df.dropna(subset=['Review Text'])
+    titles = df['Title'].fillna('') if 'Title' in df.columns else ''
+    return (titles + ' ' + df['Review Text']).tolist()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', required=True, help="Local model directory with tokenizer.json (MODEL_DIR)")
+    parser.add_argument('--csv', help="Calibrate on this CSV instead of synthetic reviews")
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--profile', choices=list(LENGTH_PROFILES) + ['mixed'], default='mixed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=200, help="Rows per chunk for the estimate error")
+    args = parser.parse_args()
+
+    texts = review_texts(args)
+    tokenizer = Tokenizer.from_file(os.path.join(args.model_dir, 'tokenizer.json'))
+    tokenizer.no_truncation()
+    tokens = np.array([len(encoding.ids) for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)])
+    chars = np.array([len(text) for text in texts])
+
+    chars_per_token = chars.sum() / tokens.sum()
+    print(f"{len(texts)} reviews, {tokens.sum()} tokens, {chars.sum()} characters")
+    print(f"Per review: {np.percentile(chars / np.maximum(tokens, 1), [5, 50, 95]).round(2)} chars/token (p5, p50, p95)")
+
+    # How far the Splitter's estimate is off for whole chunks, which is what the budget packs
+    estimate = np.ceil(chars / chars_per_token)
+    errors = [
+        estimate[i:i + args.chunk_rows].sum() / tokens[i:i + args.chunk_rows].sum() - 1
+        for i in range(0, len(texts), args.chunk_rows)
+    ]
+    print(f"Chunks of {args.chunk_rows} rows: estimate error {np.mean(np.abs(errors)):.1%} mean, {np.max(np.abs(errors)):.1%} max")
+    print(f"\nSet CHARS_PER_TOKEN={chars_per_token:.2f} on the Splitter.")
@@ -0,0 +1,70 @@
+"""
+Compares two pipeline benchmark results and flags regressions.
+
+For every stage it prints rows/s, p99 latency and peak RSS of both runs with the
+relative change. A stage regresses when its throughput drops, or its p99 latency or
+peak RSS grows, by more than the tolerance; the script then exits with status 1 so it
+can gate a deploy.
+
+Usage: python compare.py <baseline.json> <candidate.json> [--tolerance 0.10]
+"""
+import argparse
+import json
+import sys
+
+# (key, label, True if higher is better)
+METRICS = [
+    (('rows_per_second',), 'rows/s', True),
+    (('latency', 'p99'), 'p99 s', False),
+    (('peak_rss_mb',), 'peak RSS MB', False),
+]
+
+
+def metric(stage, path):
+    value = stage
+    for key in path:
+        value = value.get(key) if value else None
+    return value
+
+
+def compare(baseline, candidate, tolerance):
+    """Prints the side-by-side table and returns the list of regressions."""
+    regressions = []
+    print(f"baseline:  {baseline['label']} ({baseline['git_commit']}, {baseline['timestamp']})")
+    print(f"candidate: {candidate['label']} ({candidate['git_commit']}, {candidate['timestamp']})")
+    if baseline['config']['rows'] != candidate['config']['rows'] or baseline['config']['profile'] != candidate['config']['profile']:
+        print("--> WARNING: the runs used different inputs; throughput is not directly comparable.")
+
+    print(f"\n{'stage':<10} {'metric':<12} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name, stage in candidate['stages'].items():
+        base_stage = baseline['stages'].get(name)
+        if base_stage is None:
+            continue
+        for path, label, higher_is_better in METRICS:
+            old, new = metric(base_stage, path), metric(stage, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = '  <-- regression' if worse > tolerance else ''
+            if flag:
+                regressions.append(f"{name} {label}")
+            print(f"{name:<10} {label:<12} {old:>10.3f} {new:>10.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative change (default 10%%)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    regressions = compare(baseline, candidate, args.tolerance)
+    if regressions:
+        sys.exit(f"\nRegressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+    print("\nNo regressions.")
@@ -0,0 +1,127 @@
+"""
+Multi-core scaling benchmark for the Processor's inference.
+
+Scores the same synthetic reviews with 1 to N cores in two execution modes:
+
+    workers  - N forked single-threaded workers sharing the weights (INFERENCE_WORKERS=N)
+    threads  - one process with N intra-op threads (INFERENCE_WORKERS=1, INFERENCE_THREADS=N)
+
+Each configuration runs in a fresh process, so thread pools and caches never leak
+from one measurement into the next. For every configuration it reports rows/s, the
+speedup over one core and the parallel efficiency (speedup / cores). Lambda gives
+1 vCPU per 1,769 MB of memory and 6 at 10,240 MB; run this on a machine with at
+least as many cores as the largest configuration, or the extra workers only share
+the same cores (those rows are marked).
+
+Usage: python inference_scaling.py --model-dir /opt/model [--topic-model-dir /opt/topic-model] [--max-cores 6]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+
+from pipeline_benchmark import REPO_ROOT, RESULTS_DIR, git_commit
+from synthetic_reviews import LENGTH_PROFILES, generate_reviews
+
+sys.path.insert(0, str(REPO_ROOT / 'src' / 'processor_lambda'))
+from inference import SentimentEngine, TopicTagger  # noqa: E402
+from workers import InferencePool, available_cores  # noqa: E402
+
+TOPIC_LABELS = ['price', 'quality', 'shipping', 'customer service', 'fit', 'fabric']
+
+
+def measure(args, mode, cores, texts):
+    """Loads the models for one configuration and returns the best rows/s over the repeats."""
+    workers, threads = (cores, 1) if mode == 'workers' else (1, cores)
+    engine = SentimentEngine(args.model_dir, backend=args.backend, batch_size=args.batch_size, threads=threads)
+    functions = {'sentiment': engine.predict}
+    if args.topic_model_dir:
+        tagger = TopicTagger(args.topic_model_dir, TOPIC_LABELS, backend=args.backend,
+                             batch_size=args.batch_size, threads=threads)
+        functions['topics'] = tagger.tag
+    pool = InferencePool(functions, workers) if workers > 1 else None
+
+    def run_all(batch):
+        for name, function in functions.items():
+            pool.run(name, batch) if pool else function(batch)
+
+    run_all(texts[:args.batch_size])  # Warm-up
+    timings = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        run_all(texts)
+        timings.append(time.perf_counter() - start)
+    if pool:
+        pool.close()
+    return {'mode': mode, 'cores': cores, 'workers': workers, 'threads': threads,
+            'seconds': min(timings), 'rows_per_second': len(texts) / min(timings)}
+
+
+def run_benchmark(args):
+    texts = generate_reviews(args.rows, args.profile, args.seed)['Review Text'].dropna().tolist()
+    machine_cores = available_cores()
+    print(f"{len(texts)} reviews, {machine_cores} available cores, backend {args.backend}")
+
+    results = []
+    for mode in args.modes:
+        for cores in range(1, args.max_cores + 1):
+            # A fresh interpreter per configuration; the pool inside it forks from there
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(measure, args, mode, cores, texts).result()
+            result['oversubscribed'] = cores > machine_cores
+            results.append(result)
+            print(f"{mode:<8} {cores} cores: {result['rows_per_second']:.1f} rows/s")
+
+    for result in results:
+        baseline = next(r for r in results if r['mode'] == result['mode'] and r['cores'] == 1)
+        result['speedup'] = result['rows_per_second'] / baseline['rows_per_second']
+        result['efficiency'] = result['speedup'] / result['cores']
+
+    return {
+        'label': args.label,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': machine_cores},
+        'config': {
+            'rows': len(texts), 'profile': args.profile, 'seed': args.seed, 'backend': args.backend,
+            'batch_size': args.batch_size, 'repeats': args.repeats, 'topics': bool(args.topic_model_dir),
+        },
+        'results': results,
+    }
+
+
+def print_report(result):
+    print(f"\n{'mode':<8} {'cores':>5} {'rows/s':>10} {'speedup':>8} {'efficiency':>10}")
+    for row in result['results']:
+        note = '  (more than the available cores)' if row['oversubscribed'] else ''
+        print(f"{row['mode']:<8} {row['cores']:>5} {row['rows_per_second']:>10.1f} "
+              f"{row['speedup']:>7.2f}x {row['efficiency']:>10.0%}{note}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', required=True, help="Local sentiment model directory (MODEL_DIR)")
+    parser.add_argument('--topic-model-dir', help="Also time topic tagging with this sentence encoder")
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='onnx')
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--profile', choices=list(LENGTH_PROFILES) + ['mixed'], default='typical')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=32, help="Rows per padded forward pass")
+    parser.add_argument('--max-cores', type=int, default=6)
+    parser.add_argument('--modes', nargs='+', choices=['workers', 'threads'], default=['workers', 'threads'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--label', default='inference-scaling')
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/<timestamp>-<label>.json)")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print_report(result)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults saved to {output}")
@@ -0,0 +1,335 @@
+"""
+Offline end-to-end benchmark of the Splitter -> Processor -> Stitcher pipeline.
+
+Runs the real Lambda handlers in this process against a local moto server standing in
+for S3, SQS and DynamoDB (or any endpoint given with --endpoint-url, e.g. LocalStack).
+A synthetic CSV is uploaded to the Bronze bucket, the Splitter is invoked with the S3
+event, the queue is drained into the Processor in SQS-sized batches, and the Stitcher
+writes the Gold output. For every stage it reports rows/s, p50/p99 latency and the peak
+RSS observed while the stage ran, and writes everything to a JSON file that
+compare.py can diff against another run.
+
+The Splitter and Stitcher latencies are their single invocation. The Processor's are
+per chunk, taken from the stage seconds it records for each chunk: the chunk's own
+load, clean and write times plus its share (by rows) of the inference pass, which
+runs once over all the chunks of an invocation. Whole invocations are reported
+separately as invocation_latency.
+
+The Processor loads its models at import time, so --model-dir and --topic-model-dir
+should point to local model directories (e.g. the output of
+src/processor_lambda/export_onnx.py and of its --encoder mode); the import time is
+reported separately as the cold start. --env TOPIC_LABELS= turns topic tagging off.
+
+Usage:
+    python pipeline_benchmark.py --rows 20000 --profile mixed --model-dir /opt/model --topic-model-dir /opt/topic-model
+    python pipeline_benchmark.py --rows 5000 --env BATCH_SIZE=500 --env GOLD_LAYOUT=partitioned --label small-batches
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+
+from synthetic_reviews import LENGTH_PROFILES, write_reviews_csv
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+REGION = 'us-east-1'
+
+
+class PeakRSS:
+    """Samples the resident set size of this process while the block runs and keeps the maximum."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current_bytes():
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # Not Linux: fall back to the lifetime peak (bytes on macOS, KiB elsewhere)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_bytes = self.current_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+
+
+def latency_stats(latencies):
+    """Summarizes a list of latencies in seconds."""
+    if not latencies:
+        return None
+    values = np.asarray(latencies)
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+def stage_result(rows, seconds, latencies, rss, **extra):
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else None,
+        'latency': latency_stats(latencies),
+        'peak_rss_mb': rss.peak_bytes / 2**20,
+        'rss_growth_mb': (rss.peak_bytes - rss.start_bytes) / 2**20,
+        **extra,
+    }
+
+
+def load_lambda(name, quiet):
+    """Imports src/<name>/main.py under a unique module name, with the Lambda's directory on sys.path."""
+    lambda_dir = REPO_ROOT / 'src' / name
+    sys.path.insert(0, str(lambda_dir))
+    try:
+        spec = importlib.util.spec_from_file_location(f"bench_{name}", lambda_dir / 'main.py')
+        module = importlib.util.module_from_spec(spec)
+        with quiet():
+            spec.loader.exec_module(module)
+        return module
+    finally:
+        sys.path.remove(str(lambda_dir))
+
+
+def start_moto_server():
+    """Starts an in-process moto server on a free port and returns its URL."""
+    from moto.server import ThreadedMotoServer
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No per-request access log
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    return f"http://127.0.0.1:{port}"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Context:
+    """The subset of the Lambda context object the handlers use."""
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def run_benchmark(args):
+    import boto3
+
+    run_id = uuid.uuid4().hex[:8]
+    names = {
+        'bronze': f"bench-bronze-{run_id}", 'silver': f"bench-silver-{run_id}",
+        'gold': f"bench-gold-{run_id}", 'queue': f"bench-queue-{run_id}", 'table': f"bench-jobs-{run_id}",
+    }
+
+    # 1. Point every client at the local stand-ins and configure the Lambdas through their environment
+    endpoint_url = args.endpoint_url or start_moto_server()
+    os.environ.update({
+        'AWS_ENDPOINT_URL': endpoint_url,
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'testing'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get('AWS_SECRET_ACCESS_KEY', 'testing'),
+    })
+    s3_client = boto3.client('s3')
+    sqs_client = boto3.client('sqs')
+    for bucket in (names['bronze'], names['silver'], names['gold']):
+        s3_client.create_bucket(Bucket=bucket)
+    queue_url = sqs_client.create_queue(QueueName=names['queue'])['QueueUrl']
+    boto3.client('dynamodb').create_table(
+        TableName=names['table'],
+        KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    lambda_env = {
+        'SQS_QUEUE_URL': queue_url,
+        'DYNAMODB_TABLE_NAME': names['table'],
+        'SILVER_BUCKET_NAME': names['silver'],
+        'GOLD_BUCKET_NAME': names['gold'],
+        'STAGING_BUCKET_NAME': names['silver'],
+        'STITCHER_FUNCTION_NAME': '',  # The Stitcher is timed as its own stage below
+        'SENTIMENT_CACHE_PATH': '',  # Measure the model, not the cache, unless --env overrides it
+        'INFERENCE_BACKEND': args.backend,
+    }
+    if args.model_dir:
+        lambda_env['MODEL_DIR'] = args.model_dir
+    if args.topic_model_dir:
+        lambda_env['TOPIC_MODEL_DIR'] = args.topic_model_dir
+    lambda_env.update(dict(item.split('=', 1) for item in args.env))
+    os.environ.update(lambda_env)
+
+    quiet = (lambda: contextlib.nullcontext()) if args.verbose else (lambda: contextlib.redirect_stdout(io.StringIO()))
+
+    # 2. Generate and upload the synthetic reviews
+    csv_path = RESULTS_DIR / f"reviews-{run_id}.csv"
+    RESULTS_DIR.mkdir(exist_ok=True)
+    df = write_reviews_csv(csv_path, args.rows, args.profile, args.seed)
+    file_key = f"{run_id}/reviews.csv"
+    if args.compression != 'none':
+        # Like the dashboard: the Splitter decompresses by key suffix while it streams
+        compressed_path = csv_path.with_suffix(f".csv.{args.compression}")
+        with pa.CompressedOutputStream(str(compressed_path), args.compression) as out:
+            out.write(csv_path.read_bytes())
+        csv_path.unlink()
+        csv_path = compressed_path
+        file_key += {'gzip': '.gz', 'zstd': '.zst'}[args.compression]
+    upload_bytes = csv_path.stat().st_size
+    s3_client.upload_file(str(csv_path), names['bronze'], file_key)
+    csv_path.unlink()
+    print(f"Uploaded {args.rows} synthetic '{args.profile}' reviews to s3://{names['bronze']}/{file_key} ({upload_bytes / 1e6:.1f} MB)")
+
+    results = {}
+
+    # 3. Splitter: one invocation for the whole file
+    splitter = load_lambda('splitter_lambda', quiet)
+    event = {'Records': [{'s3': {'bucket': {'name': names['bronze']}, 'object': {'key': file_key}}}]}
+    with PeakRSS() as rss, quiet():
+        start = time.perf_counter()
+        response = splitter.handler(event, Context())
+        seconds = time.perf_counter() - start
+    job_id = response['body'].split()[1]
+    results['splitter'] = stage_result(args.rows, seconds, [seconds], rss)
+    print(f"Splitter: {seconds:.2f}s for job {job_id}")
+
+    # 4. Processor: drain the queue in SQS-sized batches, timing every invocation
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        processor = load_lambda('processor_lambda', quiet)
+        cold_start = time.perf_counter() - start
+    invocation_latencies, chunk_latencies, failures = [], [], 0
+    record_chunk_completed = processor.record_chunk_completed
+
+    def record_chunk_latency(job_id, chunk_id, chunk_seconds=None, rows=0):
+        # The same per-chunk seconds the Processor rolls into the job's stage_seconds
+        chunk_latencies.append(sum((chunk_seconds or {}).values()))
+        return record_chunk_completed(job_id, chunk_id, chunk_seconds, rows)
+
+    processor.record_chunk_completed = record_chunk_latency
+    with PeakRSS() as rss:
+        while True:
+            messages = sqs_client.receive_message(
+                QueueUrl=queue_url, MaxNumberOfMessages=args.sqs_batch_size, WaitTimeSeconds=1
+            ).get('Messages', [])
+            if not messages:
+                break
+            records = [{'messageId': message['MessageId'], 'body': message['Body']} for message in messages]
+            with quiet():
+                start = time.perf_counter()
+                response = processor.handler({'Records': records}, Context())
+                latency = time.perf_counter() - start
+            invocation_latencies.append(latency)
+            failures += len(response['batchItemFailures'])
+            sqs_client.delete_message_batch(QueueUrl=queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']} for i, message in enumerate(messages)
+            ])
+    seconds = sum(invocation_latencies)
+    results['processor'] = stage_result(
+        args.rows, seconds, chunk_latencies, rss,
+        cold_start_seconds=cold_start,
+        invocation_latency=latency_stats(invocation_latencies),
+        failed_messages=failures
+    )
+    print(f"Processor: {seconds:.2f}s over {len(invocation_latencies)} invocations (cold start {cold_start:.2f}s)")
+
+    # 5. Stitcher: one invocation for the whole job
+    stitcher = load_lambda('stitcher_lambda', quiet)
+    with PeakRSS() as rss, quiet():
+        start = time.perf_counter()
+        response = stitcher.handler({'job_id': job_id}, Context())
+        seconds = time.perf_counter() - start
+    results['stitcher'] = stage_result(args.rows, seconds, [seconds], rss, status_code=response['statusCode'])
+    print(f"Stitcher: {seconds:.2f}s (status {response['statusCode']})")
+
+    total_seconds = sum(stage['seconds'] for stage in results.values())
+    return {
+        'label': args.label,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'config': {
+            'rows': args.rows, 'profile': args.profile, 'seed': args.seed,
+            'mean_review_words': float(df['Review Text'].str.split().str.len().mean()),
+            'sqs_batch_size': args.sqs_batch_size, 'backend': args.backend, 'model_dir': args.model_dir,
+            'compression': args.compression, 'upload_bytes': upload_bytes,
+            'settings': dict(item.split('=', 1) for item in args.env),
+        },
+        'stages': results,
+        'total': {'seconds': total_seconds, 'rows_per_second': args.rows / total_seconds},
+    }
+
+
+def print_report(result):
+    print("\nLatency per invocation; for the processor, per chunk from its recorded stage seconds.")
+    print(f"{'stage':<10} {'rows/s':>10} {'p50 s':>9} {'p99 s':>9} {'peak RSS MB':>12}")
+    for name, stage in result['stages'].items():
+        print(f"{name:<10} {stage['rows_per_second']:>10.1f} {stage['latency']['p50']:>9.3f} "
+              f"{stage['latency']['p99']:>9.3f} {stage['peak_rss_mb']:>12.1f}")
+    print(f"{'total':<10} {result['total']['rows_per_second']:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--profile', choices=list(LENGTH_PROFILES) + ['mixed'], default='typical')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model-dir', help="Local model directory for the Processor (MODEL_DIR)")
+    parser.add_argument('--topic-model-dir', help="Local sentence encoder directory for topic tagging (TOPIC_MODEL_DIR)")
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='onnx')
+    parser.add_argument('--compression', choices=['none', 'gzip', 'zstd'], default='none', help="Upload the CSV compressed")
+    parser.add_argument('--sqs-batch-size', type=int, default=10, help="Messages per Processor invocation")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Extra Lambda setting, e.g. BATCH_SIZE=500 (repeatable)")
+    parser.add_argument('--endpoint-url', help="Use this AWS endpoint instead of starting a moto server")
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/<timestamp>-<label>.json)")
+    parser.add_argument('--verbose', action='store_true', help="Show the handlers' own logging")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print_report(result)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults saved to {output}")
@@ -0,0 +1,115 @@
+"""
+Synthetic review generator for the pipeline benchmarks.
+
+Produces CSV files with the same columns as the Women's E-Commerce Clothing Reviews
+dataset the pipeline was built for, with a configurable number of rows and review
+length distribution. Reviews are assembled from a fixed vocabulary of clothing
+phrases, so the output is deterministic for a given seed and needs no network access.
+
+Length profiles (words per review):
+    short    - mostly one-liners (~10 words)
+    typical  - log-normal around ~60 words, like the original dataset
+    long     - mostly above the model's 512-token window (~600 words)
+    mixed    - 70% typical, 20% short, 10% long
+
+Usage: python synthetic_reviews.py <output.csv> [--rows N] [--profile typical] [--seed 0]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+LENGTH_PROFILES = {
+    'short': {'mean_words': 10, 'sigma': 0.4},
+    'typical': {'mean_words': 60, 'sigma': 0.6},
+    'long': {'mean_words': 600, 'sigma': 0.3},
+}
+MIXED_PROFILE = {'typical': 0.7, 'short': 0.2, 'long': 0.1}
+
+POSITIVE_PHRASES = [
+    "love this dress", "the fabric is soft", "fits perfectly", "true to size", "great quality",
+    "very flattering", "I get compliments every time", "the color is gorgeous", "comfortable all day",
+    "would buy again", "washes well", "the cut is beautiful", "perfect for summer", "worth the price",
+]
+NEGATIVE_PHRASES = [
+    "runs small", "the fabric is thin", "returned it", "poor quality", "the seams came apart",
+    "not as pictured", "too see-through", "the zipper broke", "itchy material", "shipping took forever",
+    "customer service was unhelpful", "strange fit", "faded after one wash", "overpriced",
+]
+NEUTRAL_PHRASES = [
+    "I ordered my usual size", "I am five foot four", "I wore it to work", "the length hits at the knee",
+    "I usually wear a medium", "it came in a nice box", "I bought it on sale", "the pockets are deep",
+]
+TITLES = ["Love it", "Disappointed", "Nice top", "Runs small", "Beautiful", "Not for me", "Great jeans", ""]
+DIVISIONS = ['General', 'General Petite', 'Initmates']
+DEPARTMENTS = ['Tops', 'Dresses', 'Bottoms', 'Intimate', 'Jackets', 'Trend']
+CLASSES = ['Knits', 'Blouses', 'Dresses', 'Pants', 'Jeans', 'Sweaters', 'Lounge', 'Skirts', 'Outerwear']
+
+
+def review_lengths(rng, rows, profile):
+    """Returns the number of words of each review for a length profile."""
+    if profile == 'mixed':
+        names = rng.choice(list(MIXED_PROFILE), size=rows, p=list(MIXED_PROFILE.values()))
+        lengths = np.empty(rows, dtype=int)
+        for name in MIXED_PROFILE:
+            mask = names == name
+            lengths[mask] = review_lengths(rng, int(mask.sum()), name)
+        return lengths
+    params = LENGTH_PROFILES[profile]
+    lengths = rng.lognormal(np.log(params['mean_words']), params['sigma'], size=rows)
+    return np.maximum(lengths.astype(int), 3)
+
+
+def review_text(rng, words, positive):
+    """Assembles a review of roughly `words` words, mostly from the phrases matching its sentiment."""
+    main, other = (POSITIVE_PHRASES, NEGATIVE_PHRASES) if positive else (NEGATIVE_PHRASES, POSITIVE_PHRASES)
+    sentences, count = [], 0
+    while count < words:
+        pool = rng.choice(3, p=[0.7, 0.2, 0.1])
+        phrases = (main, NEUTRAL_PHRASES, other)[pool]
+        sentence = phrases[rng.integers(len(phrases))]
+        sentences.append(sentence[0].upper() + sentence[1:] + '.')
+        count += len(sentence.split())
+    return ' '.join(sentences)
+
+
+def generate_reviews(rows, profile='typical', seed=0):
+    """Returns a DataFrame of synthetic reviews in the layout of the original dataset."""
+    rng = np.random.default_rng(seed)
+    ratings = rng.choice([1, 2, 3, 4, 5], size=rows, p=[0.04, 0.07, 0.12, 0.22, 0.55])
+    lengths = review_lengths(rng, rows, profile)
+    texts = [review_text(rng, words, rating >= 4) for words, rating in zip(lengths, ratings)]
+
+    df = pd.DataFrame({
+        'Clothing ID': rng.integers(0, 1200, size=rows),
+        'Age': rng.integers(18, 90, size=rows),
+        'Title': rng.choice(TITLES, size=rows),
+        'Review Text': texts,
+        'Rating': ratings,
+        'Recommended IND': (ratings >= 4).astype(int),
+        'Positive Feedback Count': rng.poisson(2.5, size=rows),
+        'Division Name': rng.choice(DIVISIONS, size=rows),
+        'Department Name': rng.choice(DEPARTMENTS, size=rows),
+        'Class Name': rng.choice(CLASSES, size=rows),
+    })
+    # Like the original data, a few reviews have no text or title
+    df.loc[rng.random(rows) < 0.03, 'Review Text'] = None
+    df.loc[df['Title'] == '', 'Title'] = None
+    return df
+
+
+def write_reviews_csv(path, rows, profile='typical', seed=0):
+    """Writes the synthetic reviews as a CSV with the dataset's unnamed index column."""
+    df = generate_reviews(rows, profile, seed)
+    df.to_csv(path)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--profile', choices=list(LENGTH_PROFILES) + ['mixed'], default='typical')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    df = write_reviews_csv(args.output, args.rows, args.profile, args.seed)
+    print(f"Wrote {len(df)} reviews to {args.output} (mean length {df['Review Text'].str.split().str.len().mean():.0f} words).")
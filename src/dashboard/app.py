@@ -1,12 +1,25 @@
 import streamlit as st
 import pandas as pd
 import boto3
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
 import uuid
 import json
 import os
+import io
+import zlib
 import requests
 import time
 import plotly.express as px
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # Uploads fall back to gzip
+    zstandard = None
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -27,17 +40,44 @@ if 'job_status' not in st.session_state:
 S3_BRONZE_BUCKET = "reviewlens-bronze-bucket-kevin"
 GOLD_BUCKET_NAME = "reviewlens-gold-bucket-kevin"
 API_URL = st.secrets.get("API_URL", "")
+STATUS_WAIT_SECONDS = 20  # Long-poll duration; the status API answers as soon as the job changes
+
+# Uploads are compressed on the fly and sent as a parallel multipart upload; the Splitter
+# decompresses them by key suffix. 'zstd' needs the zstandard package, 'none' sends plain CSV.
+UPLOAD_COMPRESSION = st.secrets.get("UPLOAD_COMPRESSION", "zstd" if zstandard else "gzip")
+UPLOAD_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+UPLOAD_PART_SIZE = 8 * 1024 * 1024  # Bytes per multipart part (S3 minimum is 5 MB)
+UPLOAD_CONCURRENCY = 8  # Parts in flight
+UPLOAD_READ_BLOCK = 1024 * 1024  # Bytes of CSV compressed per step
+
+EXPLORER_PAGE_SIZE = 100  # Rows per Data Explorer page; the KPIs and charts come from the summary
+DEFAULT_EXPLORER_COLUMNS = ['Clothing ID', 'Age', 'Rating', 'Department Name', 'full_review_text', 'sentiment_label', 'sentiment_score', 'topic']
 
 @st.cache_resource
-def get_s3_client():
+def get_boto3_session():
     try:
-        s3 = boto3.client(
-            's3',
+        return boto3.Session(
             aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
             aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
             region_name=st.secrets["AWS_DEFAULT_REGION"]
         )
-        return s3
+    except KeyError:
+        st.error("AWS secrets not found in Streamlit configuration. Please add them.")
+        return None
+
+@st.cache_resource
+def get_s3_client():
+    session = get_boto3_session()
+    return session.client('s3') if session else None
+
+@st.cache_resource
+def get_gold_filesystem():
+    try:
+        return pafs.S3FileSystem(
+            access_key=st.secrets["AWS_ACCESS_KEY_ID"],
+            secret_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
+            region=st.secrets["AWS_DEFAULT_REGION"]
+        )
     except KeyError:
         st.error("AWS secrets not found in Streamlit configuration. Please add them.")
         return None
@@ -46,21 +86,36 @@ def get_s3_client():
 # Backend Communication Functions
 # =====================================================================================
 
-def check_job_status(job_id):
-    if not API_URL: return None
+@st.cache_resource
+def get_http_session():
+    """One keep-alive session for all API calls, so each poll reuses the same connection."""
+    return requests.Session()
+
+def check_job_status(job_id, known_status=None, etag=None, wait=STATUS_WAIT_SECONDS):
+    """
+    Long-polls the status API: with the ETag of the status already shown, the request is
+    held until the job changes (or the wait ends) and an unchanged job costs a bodyless 304.
+    Returns (status, etag).
+    """
+    if not API_URL: return None, None
     try:
-        response = requests.get(f"{API_URL}/status/{job_id}")
+        headers = {'If-None-Match': etag} if etag else {}
+        response = get_http_session().get(
+            f"{API_URL}/status/{job_id}", params={'wait': wait}, headers=headers, timeout=wait + 10
+        )
+        if response.status_code == 304:
+            return known_status, etag
         response.raise_for_status()
-        return response.json()
+        return response.json(), response.headers.get('ETag')
     except requests.exceptions.RequestException as e:
         st.error(f"Error checking job status: {e}")
-        return None
+        return None, None
 
 def trigger_stitcher(job_id):
     if not API_URL: return None
     try:
         payload = {"job_id": job_id}
-        response = requests.post(f"{API_URL}/stitch", json=payload)
+        response = get_http_session().post(f"{API_URL}/stitch", json=payload)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -71,17 +126,132 @@ def trigger_stitcher(job_id):
 # Data Loading for Results
 # =====================================================================================
 @st.cache_data(ttl=600)
-def load_gold_data(job_id):
-    """Loads the final Parquet file from the Gold S3 bucket."""
-    gold_path = f"s3://{GOLD_BUCKET_NAME}/{job_id}.parquet"
-    print(f"Loading data from: {gold_path}")
+def load_gold_summary(job_id):
+    """Loads the precomputed aggregates the Stitcher writes next to the Gold file."""
+    summary_key = f"{job_id}.summary.json"
+    print(f"Loading summary from: s3://{GOLD_BUCKET_NAME}/{summary_key}")
     try:
-        df = wr.s3.read_parquet(path=gold_path)
-        return df
+        response = get_s3_client().get_object(Bucket=GOLD_BUCKET_NAME, Key=summary_key)
+        return json.loads(response['Body'].read())
     except Exception as e:
         st.error(f"Could not load the final report. It may not be ready yet. Error: {e}")
-        return pd.DataFrame()
-        
+        return None
+
+def find_column(column_names, name):
+    """Returns the Gold name of a canonical column ('Department Name' may be stored as 'Department_Name' or 'department_name')."""
+    for candidate in (name, name.replace(' ', '_'), name.replace(' ', '_').lower()):
+        if candidate in column_names:
+            return candidate
+    return None
+
+def filter_cube(summary, selected_sentiment, selected_age, selected_departments):
+    """Returns the summary cube cells that match the sidebar filters."""
+    cube = pd.DataFrame(summary['cube'], columns=['sentiment_label', 'department', 'age', 'count', 'rating_sum', 'rating_count'])
+    if selected_sentiment != 'All':
+        cube = cube[cube['sentiment_label'] == selected_sentiment]
+    if selected_age is not None:
+        cube = cube[(cube['age'] >= selected_age[0]) & (cube['age'] <= selected_age[1])]
+    if selected_departments:
+        cube = cube[cube['department'].isin(selected_departments)]
+    return cube
+
+# =====================================================================================
+# Query Layer over the Gold Parquet
+# =====================================================================================
+@st.cache_data(ttl=600)
+def load_gold_manifest(job_id):
+    """Loads the file list and row-group statistics of a partitioned Gold dataset."""
+    response = get_s3_client().get_object(Bucket=GOLD_BUCKET_NAME, Key=f"{job_id}/_manifest.json")
+    return json.loads(response['Body'].read())
+
+def select_gold_files(manifest, selected_sentiment, selected_age, selected_departments):
+    """Prunes the manifest to the files whose partition values and Age statistics can match the filters."""
+    sentiment_column = find_column(manifest['partition_columns'], 'sentiment_label')
+    department_column = find_column(manifest['partition_columns'], 'Department Name')
+    age_column = find_column(manifest['sort_columns'], 'Age')
+    keys = []
+    for file in manifest['files']:
+        partition = file['partition']
+        if selected_sentiment != 'All' and sentiment_column and partition[sentiment_column] != selected_sentiment:
+            continue
+        if selected_departments and department_column and partition[department_column] not in selected_departments:
+            continue
+        if selected_age is not None and age_column:
+            ranges = [row_group['statistics'][age_column] for row_group in file['row_groups']]
+            if not any(r['min'] is not None and r['min'] <= selected_age[1] and r['max'] >= selected_age[0] for r in ranges):
+                continue
+        keys.append(file['key'])
+    return tuple(keys)
+
+@st.cache_resource(ttl=600)
+def open_gold_dataset(job_id, layout='single', keys=None):
+    """
+    Opens the Gold output as a pyarrow dataset; only footers are read until a query runs.
+    For the partitioned layout, only the given files are opened and the partition
+    columns are restored from their hive-style paths.
+    """
+    if layout != 'partitioned':
+        return ds.dataset(f"{GOLD_BUCKET_NAME}/{job_id}.parquet", format='parquet', filesystem=get_gold_filesystem())
+    manifest = load_gold_manifest(job_id)
+    if keys is None:
+        keys = tuple(file['key'] for file in manifest['files'])
+    partitioning = ds.partitioning(
+        pa.schema([(name, pa.string()) for name in manifest['partition_columns']]), flavor='hive'
+    )
+    return ds.dataset(
+        [f"{GOLD_BUCKET_NAME}/{key}" for key in keys], format='parquet', filesystem=get_gold_filesystem(),
+        partitioning=partitioning, partition_base_dir=f"{GOLD_BUCKET_NAME}/{job_id}"
+    )
+
+def build_gold_filter(column_names, selected_sentiment, selected_age, selected_departments):
+    """Translates the sidebar filters into a dataset expression, so row groups that cannot match are skipped."""
+    conditions = []
+    if selected_sentiment != 'All':
+        conditions.append(pc.field('sentiment_label') == selected_sentiment)
+    age_column = find_column(column_names, 'Age')
+    if selected_age is not None and age_column:
+        conditions.append((pc.field(age_column) >= selected_age[0]) & (pc.field(age_column) <= selected_age[1]))
+    department_column = find_column(column_names, 'Department Name')
+    if selected_departments and department_column:
+        conditions.append(pc.field(department_column).isin(selected_departments))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+@st.cache_data(ttl=600, max_entries=32)
+def query_gold_page(job_id, layout, selected_sentiment, selected_age, selected_departments, columns, page, page_size=EXPLORER_PAGE_SIZE):
+    """
+    Returns one page of the filtered Gold rows with only the requested columns. The scan
+    streams record batches and stops as soon as the page is filled, so the full result is
+    never materialized in the Streamlit process. For the partitioned layout, files that
+    cannot match are pruned through the manifest before anything is opened.
+    """
+    keys = None
+    if layout == 'partitioned':
+        keys = select_gold_files(load_gold_manifest(job_id), selected_sentiment, selected_age, selected_departments)
+        if not keys:
+            return pd.DataFrame(columns=list(columns))
+    dataset = open_gold_dataset(job_id, layout, keys)
+    scanner = dataset.scanner(
+        columns=list(columns),
+        filter=build_gold_filter(dataset.schema.names, selected_sentiment, selected_age, selected_departments)
+    )
+    to_skip, batches, collected = page * page_size, [], 0
+    for batch in scanner.to_batches():
+        if to_skip >= batch.num_rows:
+            to_skip -= batch.num_rows
+            continue
+        batch = batch.slice(to_skip, page_size - collected)
+        to_skip = 0
+        batches.append(batch)
+        collected += batch.num_rows
+        if collected >= page_size:
+            break
+    if not batches:
+        return pd.DataFrame(columns=list(columns))
+    return pa.Table.from_batches(batches).to_pandas()
+
 # =====================================================================================
 # UI Rendering Functions
 # =====================================================================================
@@ -122,8 +292,9 @@ def render_monitoring_page():
         progress_bar = st.progress(0)
         status_details = st.expander("Show Raw Status", expanded=False)
         
+        status, etag = None, None
         while True:
-            status = check_job_status(job_id)
+            status, etag = check_job_status(job_id, status, etag)
             if status:
                 st.session_state.job_status = status
                 processed = status.get('processed_batches', 0)
@@ -134,13 +305,21 @@ def render_monitoring_page():
                 progress_bar.progress(int(progress_percentage))
                 with status_details: st.json(status)
                 
-                if current_status in ['PROCESSING_COMPLETE', 'COMPLETED', 'STITCHING_FAILED']:
+                # The final report is generated automatically once the last batch is processed
+                if current_status in ['COMPLETED', 'STITCHING_FAILED'] or status.get('stitch_stale'):
                     break
-            time.sleep(5)
+            else:
+                time.sleep(5)  # Back off only when the API could not be reached
         
         current_status = st.session_state.job_status.get('status')
-        if current_status == 'PROCESSING_COMPLETE':
-            if st.button("🔗 Generate Final Report"):
+        if current_status == 'STITCHING_FAILED' or st.session_state.job_status.get('stitch_stale'):
+            if current_status == 'STITCHING_FAILED':
+                st.error("Generating the final report failed.")
+            elif current_status == 'STITCHING':
+                st.error("Generating the final report stopped responding.")
+            else:
+                st.error("Generating the final report did not start.")
+            if st.button("🔗 Retry Final Report"):
                 with st.spinner("Finalizing results..."):
                     response = trigger_stitcher(job_id)
                     if response: st.rerun()
@@ -168,66 +347,176 @@ def render_results_page():
         return
 
     st.header(f"Showing results for Job ID: `{job_id}`")
-    df = load_gold_data(job_id)
+    summary = load_gold_summary(job_id)
 
-    if not df.empty:
+    if summary and summary['total_rows'] > 0:
         # --- Sidebar Filters ---
         st.sidebar.header("Filters")
         
         # Sentiment Filter
-        sentiment_options = ['All'] + df['sentiment_label'].unique().tolist()
+        sentiment_options = ['All'] + sorted(label for label in summary['sentiment_counts'] if label)
         selected_sentiment = st.sidebar.selectbox("Filter by Sentiment", sentiment_options)
 
         # Age Filter (if Age column exists)
-        if 'Age' in df.columns:
-            min_age, max_age = int(df['Age'].min()), int(df['Age'].max())
+        selected_age = None
+        if summary['age_range']:
+            min_age, max_age = summary['age_range']
             selected_age = st.sidebar.slider("Filter by Age", min_age, max_age, (min_age, max_age))
+            if selected_age == (min_age, max_age):
+                selected_age = None  # The full range keeps reviews without an age as well
+
+        # Category Filter (if Department Name column exists)
+        selected_departments = ()
+        if summary['columns']['department']:
+            department_options = sorted(row['department'] for row in summary['by_department'] if row['department'])
+            selected_departments = tuple(st.sidebar.multiselect("Filter by Department", department_options))
         
-        # --- Filtering Logic ---
-        filtered_df = df.copy()
-        if selected_sentiment != 'All':
-            filtered_df = filtered_df[filtered_df['sentiment_label'] == selected_sentiment]
-        if 'Age' in df.columns:
-            filtered_df = filtered_df[(filtered_df['Age'] >= selected_age[0]) & (filtered_df['Age'] <= selected_age[1])]
+        # --- Filtering Logic (over the precomputed cube, not the rows) ---
+        filtered_cube = filter_cube(summary, selected_sentiment, selected_age, selected_departments)
+        total_reviews = int(filtered_cube['count'].sum())
 
         # --- Display KPIs and Charts ---
         st.subheader("Key Metrics")
         col1, col2, col3 = st.columns(3)
-        col1.metric("Total Reviews Analyzed", len(filtered_df))
+        col1.metric("Total Reviews Analyzed", total_reviews)
         
         positive_percentage = 0
-        if len(filtered_df) > 0:
-            positive_percentage = (filtered_df['sentiment_label'] == 'POSITIVE').mean() * 100
+        if total_reviews > 0:
+            positive_percentage = filtered_cube.loc[filtered_cube['sentiment_label'] == 'POSITIVE', 'count'].sum() / total_reviews * 100
         col2.metric("Positive Sentiment", f"{positive_percentage:.1f}%")
         
         avg_rating = 0
-        if 'Rating' in filtered_df.columns and len(filtered_df) > 0:
-            avg_rating = filtered_df['Rating'].mean()
+        if filtered_cube['rating_count'].sum() > 0:
+            avg_rating = filtered_cube['rating_sum'].sum() / filtered_cube['rating_count'].sum()
         col3.metric("Average Rating", f"{avg_rating:.2f} ★")
 
         st.subheader("Sentiment Distribution")
-        if not filtered_df.empty:
-            fig = px.pie(filtered_df, names='sentiment_label', title='Sentiment Breakdown', color='sentiment_label',
+        if total_reviews > 0:
+            sentiment_counts = filtered_cube.groupby('sentiment_label', as_index=False)['count'].sum()
+            fig = px.pie(sentiment_counts, names='sentiment_label', values='count', title='Sentiment Breakdown', color='sentiment_label',
                          color_discrete_map={'POSITIVE':'green', 'NEGATIVE':'red'})
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning("No data to display for the selected filters.")
 
+        # --- Job-wide breakdowns ---
+        st.subheader("Breakdowns")
+        col1, col2 = st.columns(2)
+        if summary['rating_counts']:
+            fig = px.bar(pd.DataFrame(summary['rating_counts']), x='rating', y='count', title='Rating Distribution')
+            col1.plotly_chart(fig, use_container_width=True)
+        if summary['age_histogram']:
+            age_histogram = pd.DataFrame(summary['age_histogram'])
+            age_histogram['age_group'] = age_histogram['bucket_start'].astype(str) + '-' + age_histogram['bucket_end'].astype(str)
+            fig = px.bar(age_histogram, x='age_group', y='count', title='Reviews by Age Group')
+            col2.plotly_chart(fig, use_container_width=True)
+
+        if summary['columns']['department']:
+            by_department = filtered_cube.groupby('department', as_index=False)['count'].sum().sort_values('count', ascending=False)
+            fig = px.bar(by_department, x='department', y='count', title='Reviews by Department (filtered)')
+            st.plotly_chart(fig, use_container_width=True)
+        if summary.get('by_topic'):
+            by_topic = pd.DataFrame(summary['by_topic']).fillna({'topic': 'no clear topic'})
+            by_topic['positive_share'] = by_topic['positive'] / by_topic['count']
+            fig = px.bar(by_topic, x='topic', y='count', color='positive_share', color_continuous_scale='RdYlGn',
+                         range_color=(0, 1), title='Reviews by Topic', hover_data=['rating_mean'])
+            st.plotly_chart(fig, use_container_width=True)
+        if summary['top_products']:
+            st.write(f"Top {len(summary['top_products'])} products by number of reviews")
+            st.dataframe(pd.DataFrame(summary['top_products']), use_container_width=True)
+
         st.subheader("Data Explorer")
-        st.dataframe(filtered_df, use_container_width=True)
+        gold_layout = summary.get('gold_layout', 'single')
+        column_names = open_gold_dataset(job_id, gold_layout).schema.names
+        default_columns = [find_column(column_names, name) for name in DEFAULT_EXPLORER_COLUMNS]
+        selected_columns = st.multiselect(
+            "Columns", column_names, default=[name for name in default_columns if name]
+        ) or column_names
+        page_count = max(1, -(-total_reviews // EXPLORER_PAGE_SIZE))
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1) - 1
+        page_df = query_gold_page(
+            job_id, gold_layout, selected_sentiment, selected_age, selected_departments, tuple(selected_columns), page
+        )
+        st.caption(f"Rows {page * EXPLORER_PAGE_SIZE + 1}-{page * EXPLORER_PAGE_SIZE + len(page_df)} of {total_reviews} matching reviews.")
+        st.dataframe(page_df, use_container_width=True)
 
+    elif summary:
+        st.info("The uploaded file contained no reviews to analyze.")
     else:
         st.error("Could not load data for the specified job.")
         
-def start_backend_pipeline(uploaded_file, column_map):
+class CompressingReader(io.RawIOBase):
+    """Read-only view of a file, compressed on the fly, for upload_fileobj's multipart reads."""
+
+    def __init__(self, source, compression):
+        self.source = source
+        if compression == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+        self.pending = bytearray()
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while not self.finished and (size is None or size < 0 or len(self.pending) < size):
+            block = self.source.read(UPLOAD_READ_BLOCK)
+            if block:
+                self.bytes_read += len(block)
+                self.pending += self.compressor.compress(block)
+            else:
+                self.pending += self.compressor.flush()
+                self.finished = True
+        size = len(self.pending) if size is None or size < 0 else size
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        self.bytes_sent += len(data)
+        return data
+
+def upload_to_bronze(uploaded_file, key, metadata, compression=UPLOAD_COMPRESSION):
+    """
+    Streams the file to Bronze, compressed on the fly and split into parts that are uploaded
+    in parallel, with a progress bar. Returns the object key (with the compression suffix).
+    """
     s3_client = get_s3_client()
+    uploaded_file.seek(0)
+    if compression == 'zstd' and zstandard is None:
+        compression = 'gzip'
+    extra_args = {'Metadata': metadata, 'ContentType': 'text/csv'}
+    if compression == 'none':
+        body = uploaded_file
+    else:
+        body = CompressingReader(uploaded_file, compression)
+        extra_args['ContentEncoding'] = compression
+    key += UPLOAD_SUFFIXES[compression]
+    config = TransferConfig(
+        multipart_threshold=UPLOAD_PART_SIZE, multipart_chunksize=UPLOAD_PART_SIZE, max_concurrency=UPLOAD_CONCURRENCY
+    )
+
+    # The transfer runs in the background; the page only polls its progress
+    progress = st.progress(0.0, text="Uploading...")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        upload = executor.submit(s3_client.upload_fileobj, body, S3_BRONZE_BUCKET, key, ExtraArgs=extra_args, Config=config)
+        while not upload.done():
+            done = (body.bytes_read if compression != 'none' else uploaded_file.tell()) / max(uploaded_file.size, 1)
+            progress.progress(min(done, 1.0), text=f"Uploading... {done:.0%}")
+            time.sleep(0.2)
+        upload.result()  # Re-raises a failed upload; the multipart upload is aborted by then
+    sent = body.bytes_sent if compression != 'none' else uploaded_file.size
+    progress.progress(1.0, text=f"Uploaded {uploaded_file.size / 1e6:.1f} MB as {sent / 1e6:.1f} MB ({compression}).")
+    return key
+
+def start_backend_pipeline(uploaded_file, column_map):
     job_id = str(uuid.uuid4())
     column_mapping = {"Review Text": column_map.get("review_text_col"), "Rating": column_map.get("rating_col"), "Clothing ID": column_map.get("product_id_col"), "Title": column_map.get("title_col"), "Age": column_map.get("age_col")}
     metadata = {"job_id": job_id, "column_mapping": json.dumps({k: v for k, v in column_mapping.items() if v is not None})}
     with st.spinner(f"Uploading file and starting job {job_id}..."):
         try:
-            uploaded_file.seek(0)
-            s3_client.put_object(Bucket=S3_BRONZE_BUCKET, Key=f"{job_id}/{uploaded_file.name}", Body=uploaded_file, Metadata=metadata)
+            upload_to_bronze(uploaded_file, f"{job_id}/{uploaded_file.name}", metadata)
             st.success(f"Job {job_id} started successfully!")
             st.session_state.job_id = job_id
             st.session_state.page = 'monitoring'
@@ -0,0 +1,167 @@
+import hashlib
+import sqlite3
+import time
+from decimal import Decimal
+
+
+def normalize_review_text(text):
+    """Collapses whitespace so trivially different copies of a review share a cache entry."""
+    return ' '.join(text.split())
+
+
+def cache_key(text, namespace):
+    """Content address of a review: the hash of the namespace (model id) and its normalized text."""
+    payload = f"{namespace}\x00{normalize_review_text(text)}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+class SentimentCache:
+    """
+    Sits in front of the model call. Reviews are looked up by content address, only
+    the misses are sent to the model, and the new predictions are written back.
+    Duplicate reviews within the same batch are scored once.
+    """
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    def score(self, texts, predict):
+        """Returns (labels, scores) for the texts, calling predict(texts) for cache misses only."""
+        keys = [cache_key(text, self.namespace) for text in texts]
+        results = self.backend.get_many(set(keys))
+
+        # Keep one representative text per missing key
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in results:
+                missing.setdefault(key, text)
+
+        self.hits += len(keys) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            labels, scores = predict(list(missing.values()))
+            fresh = dict(zip(missing.keys(), zip(labels, scores)))
+            self.backend.put_many(fresh)
+            results.update(fresh)
+
+        return [results[key][0] for key in keys], [results[key][1] for key in keys]
+
+
+class SQLiteCache:
+    """Local on-disk backend (e.g. under /tmp) with least-recently-used eviction."""
+
+    def __init__(self, path, max_entries=200_000):
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sentiment "
+            "(key TEXT PRIMARY KEY, label TEXT NOT NULL, score REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS sentiment_last_used ON sentiment (last_used)")
+        self.connection.commit()
+        # Counted once here and kept up to date by the writes, so puts never scan the table
+        (self.count,) = self.connection.execute("SELECT COUNT(*) FROM sentiment").fetchone()
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        # Stay well below SQLite's bound-variable limit
+        for start in range(0, len(keys), 500):
+            window = keys[start:start + 500]
+            placeholders = ','.join('?' * len(window))
+            rows = self.connection.execute(
+                f"SELECT key, label, score FROM sentiment WHERE key IN ({placeholders})", window
+            )
+            found.update({key: (label, score) for key, label, score in rows})
+        if found:
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE sentiment SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+            )
+            self.connection.commit()
+        return found
+
+    def put_many(self, entries):
+        now = time.time()
+        # Only inserted rows grow the table; keys that already exist are updated in place
+        inserted = self.connection.executemany(
+            "INSERT OR IGNORE INTO sentiment (key, label, score, last_used) VALUES (?, ?, ?, ?)",
+            [(key, label, score, now) for key, (label, score) in entries.items()]
+        ).rowcount
+        if inserted < len(entries):
+            self.connection.executemany(
+                "UPDATE sentiment SET label = ?, score = ?, last_used = ? WHERE key = ?",
+                [(label, score, now, key) for key, (label, score) in entries.items()]
+            )
+        self.count += inserted
+        if self.count > self.max_entries:
+            self.count -= self.connection.execute(
+                "DELETE FROM sentiment WHERE key IN "
+                "(SELECT key FROM sentiment ORDER BY last_used LIMIT ?)",
+                (self.count - self.max_entries,)
+            ).rowcount
+        self.connection.commit()
+
+
+class DynamoDBCache:
+    """
+    Shared backend in a DynamoDB table keyed by 'cache_key'. Pass a resource created
+    with endpoint_url to run against DynamoDB Local or another stand-in.
+    """
+
+    def __init__(self, dynamodb, table_name, ttl_days=30):
+        self.dynamodb = dynamodb
+        self.table = dynamodb.Table(table_name)
+        self.table_name = table_name
+        self.ttl_seconds = ttl_days * 24 * 3600
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        # BatchGetItem accepts at most 100 keys per call
+        for start in range(0, len(keys), 100):
+            request = {self.table_name: {'Keys': [{'cache_key': key} for key in keys[start:start + 100]]}}
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(self.table_name, []):
+                    found[item['cache_key']] = (item['label'], float(item['score']))
+                request = response.get('UnprocessedKeys')
+        return found
+
+    def put_many(self, entries):
+        expires_at = int(time.time()) + self.ttl_seconds
+        # The batch writer groups puts into BatchWriteItem calls and retries unprocessed items
+        with self.table.batch_writer(overwrite_by_pkeys=['cache_key']) as batch:
+            for key, (label, score) in entries.items():
+                batch.put_item(Item={
+                    'cache_key': key,
+                    'label': label,
+                    'score': Decimal(str(score)),
+                    'expires_at': expires_at
+                })
+
+
+class TieredCache:
+    """Checks the local backend first, then the shared one, and backfills local on shared hits."""
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get_many(self, keys):
+        found = self.local.get_many(keys)
+        remaining = set(keys) - found.keys()
+        if remaining:
+            shared_hits = self.shared.get_many(remaining)
+            if shared_hits:
+                self.local.put_many(shared_hits)
+                found.update(shared_hits)
+        return found
+
+    def put_many(self, entries):
+        self.local.put_many(entries)
+        self.shared.put_many(entries)
@@ -0,0 +1,142 @@
+"""
+Build-time model export for the Processor image.
+
+Downloads the sentiment model once, saves it to a local directory (so the
+Lambda never fetches weights at runtime), exports it to ONNX, writes an int8
+dynamically quantized copy, and checks that the quantized model agrees with
+the original pipeline on a fixed sample. The build fails if agreement drops
+below the threshold.
+
+With --encoder, the same is done for the sentence encoder used for topic
+tagging; its parity check compares the topics the int8 copy assigns with the
+ones the original weights assign.
+
+Usage: python export_onnx.py [--encoder] <output_dir> [model_id]
+"""
+import sys
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer, pipeline
+from inference import SentimentEngine, TopicTagger
+
+DEFAULT_MODEL_ID = "distilbert-base-uncased-finetuned-sst-2-english"
+DEFAULT_ENCODER_ID = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_TOPIC_LABELS = ['price', 'quality', 'shipping', 'customer service', 'fit', 'fabric']
+MIN_LABEL_AGREEMENT = 0.95
+MIN_TOPIC_AGREEMENT = 0.9
+
+# Fixed sample used for the parity check: short, long, mixed and neutral-ish reviews
+PARITY_SAMPLE = [
+    "Absolutely love this dress! The fabric is soft and it fits perfectly.",
+    "Terrible quality. The seams came apart after one wash.",
+    "Runs small, I had to return it for a larger size.",
+    "The color is exactly as pictured and the material feels expensive.",
+    "Not worth the price. Thin fabric and a strange cut.",
+    "Beautiful top, I get compliments every time I wear it.",
+    "It's okay. Nothing special but it does the job.",
+    "The zipper broke the second time I wore it, very disappointed.",
+    "Comfortable, flattering and easy to wash. Bought it in two colors!",
+    "I wanted to love this, but the fit was all wrong on me.",
+    "Great jeans, they stretch just enough and keep their shape all day.",
+    "The sweater pilled immediately and now looks old.",
+    "Perfect for summer, light and breezy.",
+    "Way too see-through, I can't wear it to work.",
+    "Ordered my usual size and it fits like a glove.",
+    "The pattern is cute but the fabric is scratchy and uncomfortable.",
+    "Excellent customer service, and the coat is warm and stylish.",
+    "The dress arrived wrinkled and smelled strange.",
+    "Best purchase of the season, highly recommend!",
+    "Cheaply made. Buttons fell off within a week.",
+    "I was hesitant because of the reviews but I am so glad I ordered it. The cut is flattering, "
+    "the length is perfect for someone who is five foot four, and the pockets are deep enough for a phone. "
+    "I have already worn it to two weddings and a dinner and received compliments each time.",
+    "Sadly this is going back. The photos make it look structured, but in person the fabric is limp and "
+    "clingy, the lining is shorter than the shell so it peeks out, and the armholes are cut so low that "
+    "you cannot wear it without a camisole underneath. For this price I expected much better.",
+]
+
+
+class ExportWrapper(torch.nn.Module):
+    """Calls the model with keyword inputs and returns only the output the Lambda reads."""
+
+    def __init__(self, model, output_name):
+        super().__init__()
+        self.model = model
+        self.output_name = output_name
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask)[self.output_name]
+
+
+def export(output_dir, model_id, encoder=False):
+    # 1. Save the tokenizer and weights locally so the image never downloads them at runtime
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = (AutoModel if encoder else AutoModelForSequenceClassification).from_pretrained(model_id)
+    model.eval()
+    output_name = 'last_hidden_state' if encoder else 'logits'
+    output_axes = {0: 'batch', 1: 'sequence'} if encoder else {0: 'batch'}
+    tokenizer.save_pretrained(output_dir)
+    model.save_pretrained(output_dir)
+
+    # 2. Export to ONNX with dynamic batch and sequence axes
+    sample = tokenizer(["a sample review", "another one"], padding=True, return_tensors='pt')
+    torch.onnx.export(
+        ExportWrapper(model, output_name),
+        (sample['input_ids'], sample['attention_mask']),
+        f"{output_dir}/model.onnx",
+        input_names=['input_ids', 'attention_mask'],
+        output_names=[output_name],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            output_name: output_axes
+        },
+        opset_version=17,
+        dynamo=False
+    )
+    print(f"Exported ONNX model to {output_dir}/model.onnx")
+
+    # 3. Write an int8 dynamically quantized copy
+    quantize_dynamic(f"{output_dir}/model.onnx", f"{output_dir}/model.int8.onnx", weight_type=QuantType.QInt8)
+    print(f"Wrote quantized model to {output_dir}/model.int8.onnx")
+
+
+def check_parity(output_dir, model_id):
+    """Compares the ONNX Runtime labels against the original pipeline on the fixed sample."""
+    reference = pipeline("sentiment-analysis", model=model_id)
+    expected = [result['label'] for result in reference([text[:512] for text in PARITY_SAMPLE])]
+    labels, _ = SentimentEngine(output_dir, backend='onnx').predict(PARITY_SAMPLE)
+
+    agreement = sum(a == b for a, b in zip(expected, labels)) / len(PARITY_SAMPLE)
+    print(f"ONNX/int8 label agreement with the original pipeline: {agreement:.1%}")
+    for text, want, got in zip(PARITY_SAMPLE, expected, labels):
+        if want != got:
+            print(f"--> MISMATCH: expected {want}, got {got} for '{text[:60]}...'")
+    return agreement
+
+
+def check_topic_parity(output_dir):
+    """Compares the topics assigned by the int8 encoder with those of the original weights on the fixed sample."""
+    expected, _ = TopicTagger(output_dir, DEFAULT_TOPIC_LABELS, backend='torch').tag(PARITY_SAMPLE)
+    topics, _ = TopicTagger(output_dir, DEFAULT_TOPIC_LABELS, backend='onnx').tag(PARITY_SAMPLE)
+
+    agreement = sum(a == b for a, b in zip(expected, topics)) / len(PARITY_SAMPLE)
+    print(f"ONNX/int8 topic agreement with the original encoder: {agreement:.1%}")
+    for text, want, got in zip(PARITY_SAMPLE, expected, topics):
+        if want != got:
+            print(f"--> MISMATCH: expected {want}, got {got} for '{text[:60]}...'")
+    return agreement
+
+
+if __name__ == '__main__':
+    encoder = sys.argv[1] == '--encoder'
+    args = sys.argv[2:] if encoder else sys.argv[1:]
+    output_dir = args[0]
+    model_id = args[1] if len(args) > 1 else (DEFAULT_ENCODER_ID if encoder else DEFAULT_MODEL_ID)
+    export(output_dir, model_id, encoder)
+    if encoder:
+        agreement, threshold = check_topic_parity(output_dir), MIN_TOPIC_AGREEMENT
+    else:
+        agreement, threshold = check_parity(output_dir, model_id), MIN_LABEL_AGREEMENT
+    if agreement < threshold:
+        sys.exit(f"Parity check failed: agreement is below {threshold:.0%}.")
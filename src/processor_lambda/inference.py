@@ -0,0 +1,229 @@
+import json
+import os
+import time
+import numpy as np
+
+
+OUTPUTS = {'classify': 'logits', 'embed': 'last_hidden_state'}  # Model output used for each task
+
+
+def padded_batches(input_ids, batch_size, pad_token_id):
+    """
+    Yields (rows, batch_ids, attention_mask) for length-bucketed mini-batches: rows are
+    sorted by token length so padding within a mini-batch stays minimal.
+    """
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        width = len(input_ids[bucket[-1]])
+        batch_ids = np.full((len(bucket), width), pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(bucket), width), dtype=np.int64)
+        for position, row in enumerate(bucket):
+            batch_ids[position, :len(input_ids[row])] = input_ids[row]
+            attention_mask[position, :len(input_ids[row])] = 1
+        yield bucket, batch_ids, attention_mask
+
+
+class TorchBackend:
+    """
+    Runs the Hugging Face model with PyTorch. Accepts a local directory or a Hub model id.
+    The 'classify' task returns the classification logits, 'embed' the encoder's token states.
+    `threads` sets the intra-op threads of the process (0 keeps torch's default).
+    """
+
+    def __init__(self, model_dir, task='classify', threads=0):
+        import torch
+        from transformers import AutoModel, AutoTokenizer, AutoModelForSequenceClassification
+
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+            try:
+                torch.set_num_interop_threads(1)  # One graph runs at a time; no second pool needed
+            except RuntimeError:
+                pass  # Already set, or already used by a model loaded earlier
+        self.output_name = OUTPUTS[task]
+        hf_tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        model_class = AutoModelForSequenceClassification if task == 'classify' else AutoModel
+        self.model = model_class.from_pretrained(model_dir)
+        self.model.eval()
+        self.tokenizer = hf_tokenizer.backend_tokenizer
+        self.id2label = {int(i): label for i, label in self.model.config.id2label.items()}
+        self.pad_token_id = self.model.config.pad_token_id or 0
+        # Tokenizers may report a huge sentinel instead of the real limit
+        self.max_length = min(hf_tokenizer.model_max_length, self.model.config.max_position_embeddings)
+
+    def run(self, input_ids, attention_mask):
+        with self.torch.inference_mode():
+            outputs = self.model(
+                input_ids=self.torch.from_numpy(input_ids),
+                attention_mask=self.torch.from_numpy(attention_mask)
+            )
+        return outputs[self.output_name].float().numpy()
+
+
+class OnnxBackend:
+    """
+    Runs an ONNX export of the model (e.g. the int8 copy baked into the image) with
+    ONNX Runtime. Only the standalone tokenizers library is loaded, so torch and
+    transformers are never imported in this mode.
+    """
+
+    def __init__(self, model_dir, onnx_file='model.int8.onnx', intra_op_threads=0, task='classify'):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, 'config.json')) as f:
+            config = json.load(f)
+        self.output_name = OUTPUTS[task]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.id2label = {int(i): label for i, label in config.get('id2label', {}).items()}
+        self.pad_token_id = config.get('pad_token_id') or 0
+        self.max_length = config['max_position_embeddings']
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads  # 0 lets ONNX Runtime use every core
+        options.inter_op_num_threads = 1  # Nodes run sequentially
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, onnx_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def run(self, input_ids, attention_mask):
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        return self.session.run([self.output_name], {name: feeds[name] for name in self.input_names})[0]
+
+
+def load_backend(model_dir, backend, task='classify', threads=0):
+    if backend == 'torch':
+        return TorchBackend(model_dir, task=task, threads=threads)
+    if backend == 'onnx':
+        return OnnxBackend(model_dir, intra_op_threads=threads, task=task)
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+
+class SentimentEngine:
+    """
+    Batched sentiment inference. The whole batch is tokenized in one call, rows are
+    sorted by token length so each padded mini-batch holds reviews of similar size,
+    and the predictions are scattered back to the original row order.
+
+    Reviews are cut by tokens, never by characters, so no input can exceed the
+    model's position limit. In 'chunk' mode, reviews longer than that limit are
+    split into overlapping token windows that are scored in the same forward
+    passes, and the window logits are mean-pooled into one prediction per review.
+    """
+
+    def __init__(self, model_dir, backend='torch', batch_size=32, long_review_mode='truncate', stride=128, threads=0):
+        if long_review_mode not in ('truncate', 'chunk'):
+            raise ValueError(f"Unknown long review mode: {long_review_mode}")
+        self.backend = load_backend(model_dir, backend, threads=threads)
+        self.batch_size = batch_size
+        self.long_review_mode = long_review_mode
+        self.id2label = self.backend.id2label
+        self.stage_seconds = {'tokenize': 0.0, 'forward': 0.0}  # Cumulative, for the caller's instrumentation
+
+        self.tokenizer = self.backend.tokenizer
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(
+            max_length=self.backend.max_length, stride=stride if long_review_mode == 'chunk' else 0
+        )
+
+    def predict(self, texts):
+        """Returns two lists (labels, scores) aligned with the input texts."""
+        texts = list(texts)
+        if not texts:
+            return [], []
+
+        # 1. Tokenize everything at once; padding is deferred to each mini-batch
+        start = time.perf_counter()
+        input_ids, owners = self._encode(texts)
+        self.stage_seconds['tokenize'] += time.perf_counter() - start
+
+        # 2. Score every sequence (a whole review or one of its windows)
+        start = time.perf_counter()
+        logits = self._forward(input_ids)
+        self.stage_seconds['forward'] += time.perf_counter() - start
+
+        # 3. Mean-pool the logits of each review's windows, then pick the best label
+        pooled = np.zeros((len(texts), logits.shape[-1]), dtype=np.float64)
+        np.add.at(pooled, owners, logits)
+        pooled /= np.bincount(owners, minlength=len(texts))[:, None]
+        probabilities = np.exp(pooled - pooled.max(axis=-1, keepdims=True))
+        probabilities /= probabilities.sum(axis=-1, keepdims=True)
+
+        labels = [self.id2label[label_id] for label_id in probabilities.argmax(axis=-1).tolist()]
+        return labels, probabilities.max(axis=-1).tolist()
+
+    def _encode(self, texts):
+        """Returns the token ids of every sequence and the index of the review it belongs to."""
+        input_ids, owners = [], []
+        for owner, encoding in enumerate(self.tokenizer.encode_batch(texts)):
+            input_ids.append(encoding.ids)
+            owners.append(owner)
+            if self.long_review_mode == 'chunk':
+                for window in encoding.overflowing:
+                    input_ids.append(window.ids)
+                    owners.append(owner)
+        return input_ids, np.array(owners, dtype=np.int64)
+
+    def _forward(self, input_ids):
+        """Runs length-bucketed, padded mini-batches and returns logits in input order."""
+        logits = [None] * len(input_ids)
+        for bucket, batch_ids, attention_mask in padded_batches(input_ids, self.batch_size, self.backend.pad_token_id):
+            for row, row_logits in zip(bucket, self.backend.run(batch_ids, attention_mask)):
+                logits[row] = row_logits
+        return np.stack(logits)
+
+
+class TopicTagger:
+    """
+    Embedding-based zero-shot topic tagging. Instead of one NLI forward pass per label
+    per review, every review is encoded once by a sentence encoder (e.g. MiniLM) and
+    mean-pooled into a unit vector. The label embeddings are encoded once, when the
+    tagger is created, so tagging a batch costs one encoder pass plus a single
+    (reviews x labels) cosine-similarity matrix product, whatever the number of labels.
+    """
+
+    def __init__(self, model_dir, labels, backend='torch', batch_size=32, max_length=256,
+                 template='This review is about {}.', min_score=None, threads=0):
+        if not labels:
+            raise ValueError("TopicTagger needs at least one label")
+        self.backend = load_backend(model_dir, backend, task='embed', threads=threads)
+        self.batch_size = batch_size
+        self.labels = list(labels)
+        self.min_score = min_score  # Reviews less similar than this to every label get no topic
+
+        self.tokenizer = self.backend.tokenizer
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=min(max_length, self.backend.max_length))
+
+        # Cached for the life of the container
+        self.label_embeddings = self.embed([template.format(label) for label in self.labels])
+
+    def embed(self, texts):
+        """Returns the L2-normalized, mean-pooled embedding of every text as a (texts x dim) array."""
+        input_ids = [encoding.ids for encoding in self.tokenizer.encode_batch(list(texts))]
+        embeddings = [None] * len(input_ids)
+        for bucket, batch_ids, attention_mask in padded_batches(input_ids, self.batch_size, self.backend.pad_token_id):
+            states = self.backend.run(batch_ids, attention_mask)
+            mask = attention_mask[:, :, None].astype(states.dtype)
+            pooled = (states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+            for row, row_embedding in zip(bucket, pooled):
+                embeddings[row] = row_embedding
+        embeddings = np.stack(embeddings)
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    def tag(self, texts):
+        """Returns two lists (topics, scores) aligned with the input texts; the score is the cosine similarity."""
+        texts = list(texts)
+        if not texts:
+            return [], []
+        similarities = self.embed(texts) @ self.label_embeddings.T
+        best = similarities.argmax(axis=1)
+        scores = similarities[np.arange(len(texts)), best]
+        topics = [self.labels[i] for i in best.tolist()]
+        if self.min_score is not None:
+            topics = [topic if score >= self.min_score else None for topic, score in zip(topics, scores.tolist())]
+        return topics, scores.tolist()
@@ -1,82 +1,318 @@
 import os
+import io
 import json
+import time
 import pandas as pd
-from transformers import pipeline
+import pyarrow as pa
 import awswrangler as wr
 import boto3
+from inference import SentimentEngine, TopicTagger
+from workers import InferencePool, available_cores
+from cache import SentimentCache, SQLiteCache, DynamoDBCache, TieredCache
+from metrics import StageTimer, rollup_update
+from jobs import start_stitch_if_complete
 
 # --- Load the AI Model (once, during a cold start) ---
+MODEL_ID = os.environ.get('MODEL_ID', 'distilbert-base-uncased-finetuned-sst-2-english')
+MODEL_DIR = os.environ.get('MODEL_DIR', MODEL_ID)  # Local copy baked into the image; falls back to the Hub
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')  # 'torch' or 'onnx' (int8, no torch import)
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', 32))  # Rows per padded forward pass
+LONG_REVIEW_MODE = os.environ.get('LONG_REVIEW_MODE', 'truncate')  # 'truncate' or 'chunk' (pooled token windows)
+CHUNK_STRIDE = int(os.environ.get('CHUNK_STRIDE', 128))  # Overlapping tokens between consecutive windows
+INFERENCE_WORKERS = os.environ.get('INFERENCE_WORKERS', '1')  # Forked inference processes; 'auto' = one per vCPU
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))  # Intra-op threads per process; 0 = all vCPUs
+
+CPU_CORES = available_cores()
+inference_workers = CPU_CORES if INFERENCE_WORKERS == 'auto' else max(1, int(INFERENCE_WORKERS))
+# Forked workers run single-threaded: thread pools do not survive a fork, and the workers use the cores
+inference_threads = 1 if inference_workers > 1 else (INFERENCE_THREADS or CPU_CORES)
+print(f"Inference on {CPU_CORES} vCPUs: {inference_workers} process(es) x {inference_threads} thread(s).")
+
 print("Loading Sentiment Analysis model...")
-sentiment_pipeline = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+sentiment_engine = SentimentEngine(
+    MODEL_DIR, backend=INFERENCE_BACKEND, batch_size=INFERENCE_BATCH_SIZE,
+    long_review_mode=LONG_REVIEW_MODE, stride=CHUNK_STRIDE, threads=inference_threads
+)
 print("Model loaded successfully!")
 
+# --- Topic tagging: one sentence-encoder pass per batch, compared with cached label embeddings ---
+TOPIC_MODEL_ID = os.environ.get('TOPIC_MODEL_ID', 'sentence-transformers/all-MiniLM-L6-v2')
+TOPIC_MODEL_DIR = os.environ.get('TOPIC_MODEL_DIR', TOPIC_MODEL_ID)  # Local copy baked into the image; falls back to the Hub
+TOPIC_LABELS = [label.strip() for label in os.environ.get(
+    'TOPIC_LABELS', 'price,quality,shipping,customer service,fit,fabric'
+).split(',') if label.strip()]  # Empty disables topic tagging
+TOPIC_MIN_SCORE = os.environ.get('TOPIC_MIN_SCORE')  # Cosine similarity below which a review gets no topic
+topic_tagger = None
+if TOPIC_LABELS:
+    print(f"Loading topic encoder for labels {TOPIC_LABELS}...")
+    topic_tagger = TopicTagger(
+        TOPIC_MODEL_DIR, TOPIC_LABELS, backend=INFERENCE_BACKEND, batch_size=INFERENCE_BATCH_SIZE,
+        min_score=float(TOPIC_MIN_SCORE) if TOPIC_MIN_SCORE else None, threads=inference_threads
+    )
+    print("Topic encoder loaded successfully!")
+
+# --- Fork the inference workers last, so they share the loaded weights copy-on-write ---
+inference_pool = None
+if inference_workers > 1:
+    inference_functions = {'sentiment': sentiment_engine.predict}
+    if topic_tagger:
+        inference_functions['topics'] = topic_tagger.tag
+    inference_pool = InferencePool(inference_functions, inference_workers)
+
+def predict_sentiment(texts):
+    """Runs the sentiment model, sharded across the inference workers when there are any."""
+    return inference_pool.run('sentiment', texts) if inference_pool else sentiment_engine.predict(texts)
+
+def tag_topics(texts):
+    """Runs the topic tagger, sharded across the inference workers when there are any."""
+    return inference_pool.run('topics', texts) if inference_pool else topic_tagger.tag(texts)
+
 # --- Initialize clients and environment variables ---
 DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_TABLE_NAME']
 SILVER_BUCKET_NAME = os.environ['SILVER_BUCKET_NAME']
+STITCHER_FUNCTION_NAME = os.environ.get('STITCHER_FUNCTION_NAME')  # Started automatically when a job completes
+s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+timer = StageTimer('processor')
+
+# --- Sentiment result cache (local /tmp store, optionally backed by a shared table) ---
+SENTIMENT_CACHE_PATH = os.environ.get('SENTIMENT_CACHE_PATH', '/tmp/sentiment_cache.sqlite3')  # Empty disables it
+SENTIMENT_CACHE_MAX_ENTRIES = int(os.environ.get('SENTIMENT_CACHE_MAX_ENTRIES', 200000))
+SENTIMENT_CACHE_TABLE_NAME = os.environ.get('SENTIMENT_CACHE_TABLE_NAME')
+SENTIMENT_CACHE_ENDPOINT_URL = os.environ.get('SENTIMENT_CACHE_ENDPOINT_URL')  # e.g. DynamoDB Local
+
+def build_sentiment_cache():
+    local = SQLiteCache(SENTIMENT_CACHE_PATH, SENTIMENT_CACHE_MAX_ENTRIES) if SENTIMENT_CACHE_PATH else None
+    shared = None
+    if SENTIMENT_CACHE_TABLE_NAME:
+        cache_resource = boto3.resource('dynamodb', endpoint_url=SENTIMENT_CACHE_ENDPOINT_URL)
+        shared = DynamoDBCache(cache_resource, SENTIMENT_CACHE_TABLE_NAME)
+    backend = TieredCache(local, shared) if local and shared else (local or shared)
+    if backend is None:
+        return None
+    # Predictions also depend on the backend and on how long reviews are handled, so both are part of the key
+    return SentimentCache(backend, namespace=f"{MODEL_ID}|{INFERENCE_BACKEND}|{LONG_REVIEW_MODE}")
+
+sentiment_cache = build_sentiment_cache()
+
+NUMERIC_COLUMNS = {'Age': 'Int64', 'Rating': 'float64', 'Recommended IND': 'Int64', 'Positive Feedback Count': 'Int64'}
+
+def coerce_numeric_columns(df):
+    """Gives the numeric columns the Splitter's types, so every chunk of a job has the same schema."""
+    for column, dtype in NUMERIC_COLUMNS.items():
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors='coerce')
+            df[column] = values.round().astype(dtype) if dtype == 'Int64' else values.astype(dtype)
+    return df
+
+def normalize_range(df, renames):
+    """Applies the Splitter's normalization to a byte range: canonical names, numeric types, rows with text only."""
+    df = coerce_numeric_columns(df.rename(columns=renames))
+    has_text = df['Review Text'].notna() & (df['Review Text'].str.strip() != '')
+    return df[has_text].reset_index(drop=True)
+
+def load_batch(message_data):
+    """Returns the batch as a DataFrame, from the inline JSON, a staged Arrow file or a CSV byte range."""
+    if 'source' in message_data:
+        # Range work item: read the assigned row-aligned bytes of the Bronze CSV directly
+        source = message_data['source']
+        body = s3_client.get_object(
+            Bucket=source['bucket'], Key=source['key'], Range=f"bytes={source['start']}-{source['end'] - 1}"
+        )['Body'].read()
+        renames = source.get('renames')
+        if not renames:
+            return pd.read_csv(io.BytesIO(body), header=None, names=source['columns'])  # From an older Splitter
+        df = pd.read_csv(io.BytesIO(body), header=None, names=source['columns'], usecols=list(renames), dtype=str)
+        return normalize_range(df, renames)
+    if 'payload_uri' in message_data:
+        # Claim-check message: the rows live in S3 as an uncompressed Arrow IPC file
+        bucket, key = message_data['payload_uri'].removeprefix('s3://').split('/', 1)
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        return pa.ipc.open_file(pa.py_buffer(body)).read_all().to_pandas()
+    # JSON loses the column types; keep the text as text (e.g. 'Clothing ID') and restore the numbers
+    return coerce_numeric_columns(pd.read_json(io.StringIO(message_data['data']), orient='split', dtype=False))
+
+FINAL_COLUMNS = [
+    'Clothing ID', 'Age', 'Rating', 'Recommended IND', 'Positive Feedback Count',
+    'Division Name', 'Department Name', 'Class Name', 'full_review_text',
+    'sentiment_label', 'sentiment_score', 'topic', 'topic_score'
+]
+
+def clean_batch(df):
+    """Applies the cleaning rules to one batch and builds the text sent to the model."""
+    df_cleaned = df.drop('Unnamed: 0', axis=1, errors='ignore')
+    df_cleaned.dropna(subset=['Review Text'], inplace=True)
+    # The title is optional in the upload's column mapping
+    df_cleaned['Title'] = df_cleaned['Title'].fillna('') if 'Title' in df_cleaned.columns else ''
+    df_cleaned['full_review_text'] = df_cleaned['Title'] + ' ' + df_cleaned['Review Text']
+    try:
+        df_cleaned.dropna(subset=['Division Name', 'Department Name', 'Class Name'], inplace=True)
+    except KeyError:
+        print("Category columns not found, proceeding without them.")
+        pass
+    return df_cleaned
+
+def score_sentiment(texts):
+    """
+    Scores the texts in length-bucketed mini-batches instead of row by row, sending
+    only the reviews that are not already in the cache to the model.
+    """
+    if not sentiment_cache:
+        return predict_sentiment(texts)
+    hits, misses = sentiment_cache.hits, sentiment_cache.misses
+    labels, scores = sentiment_cache.score(texts, predict_sentiment)
+    print(f"Sentiment cache: {sentiment_cache.hits - hits} hits, {sentiment_cache.misses - misses} misses "
+          f"(container totals: {sentiment_cache.hits} hits, {sentiment_cache.misses} misses).")
+    return labels, scores
+
+def get_completed_chunks(job_id):
+    """Returns the ids of the chunks already recorded as processed for a job."""
+    response = table.get_item(
+        Key={'job_id': job_id},
+        ProjectionExpression='completed_chunks',
+        ConsistentRead=True
+    )
+    return response.get('Item', {}).get('completed_chunks', set())
+
+def record_chunk_completed(job_id, chunk_id, chunk_seconds=None, rows=0):
+    """
+    Adds a chunk to the job's completed set, increments the counter and rolls the chunk's
+    stage seconds and rows into the job totals, all in one conditional write. Returns
+    False if the chunk had already been counted (an SQS redelivery), so nothing is
+    counted twice.
+    """
+    clauses, names, values = rollup_update(chunk_seconds or {}, 'processor', {'rows_processed': rows})
+    try:
+        table.update_item(
+            Key={'job_id': job_id},
+            UpdateExpression=f"SET {', '.join(clauses)} ADD processed_batches :inc, completed_chunks :chunk",
+            ConditionExpression="NOT contains(completed_chunks, :chunk_id)",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={":inc": 1, ":chunk": {chunk_id}, ":chunk_id": chunk_id, **values}
+        )
+        return True
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
 
 def handler(event, context):
     """
-    This function is triggered by an SQS message. It reads a batch of reviews,
-    enriches it with AI sentiment analysis, saves the partial result to the Silver bucket,
-    and updates the job status in DynamoDB.
+    This function is triggered by a batch of SQS messages. It reads the reviews of every
+    message, enriches them with AI sentiment analysis in a single inference pass, saves each
+    chunk to the Silver bucket under its deterministic chunk_id, and records the chunk as
+    completed in DynamoDB exactly once. Redelivered chunks are skipped, and messages that
+    fail are reported in 'batchItemFailures' so only they are redelivered. When the last
+    batch of a job completes, the Stitcher is started asynchronously.
     """
-    print("Processor handler started...")
-    
-    # An SQS event can contain multiple messages, so we iterate through them
+    print(f"Processor handler started with {len(event['Records'])} messages...")
+    timer.reset()
+    failed_message_ids = []
+    completed_chunks = {}
+    job_message_ids = {}
+
+    # --- 1. Parse every SQS message; a message that cannot be read fails on its own ---
+    batches = []
     for record in event['Records']:
-        message_body_str = record['body']
-        
-        # --- 1. Parse the incoming SQS message ---
-        message_data = json.loads(message_body_str)
-        job_id = message_data['job_id']
-        data_json = message_data['data']
-        
-        df = pd.read_json(data_json, orient='split')
-        print(f"Successfully loaded a batch of {len(df)} rows from SQS for job {job_id}.")
-
-        # --- 2. Data Cleaning and AI Analysis Logic ---
-        df_cleaned = df.drop('Unnamed: 0', axis=1, errors='ignore')
-        df_cleaned.dropna(subset=['Review Text'], inplace=True)
-        df_cleaned['Title'] = df_cleaned['Title'].fillna('')
-        df_cleaned['full_review_text'] = df_cleaned['Title'] + ' ' + df_cleaned['Review Text']
         try:
-            df_cleaned.dropna(subset=['Division Name', 'Department Name', 'Class Name'], inplace=True)
-        except KeyError:
-            print("Category columns not found, proceeding without them.")
-            pass
-        print("Data cleaning completed for the batch.")
-
-        def get_sentiment(text):
-            result = sentiment_pipeline(text[:512])
-            return result[0]['label'], result[0]['score']
-
-        sentiments = df_cleaned['full_review_text'].apply(get_sentiment)
-        df_cleaned[['sentiment_label', 'sentiment_score']] = pd.DataFrame(sentiments.tolist(), index=df_cleaned.index)
-        print("Sentiment analysis completed for the batch.")
-        
-        # --- 3. Save the partial result to S3 with a unique name ---
-        request_id = context.aws_request_id
-        # Organize outputs in a subfolder named after the job_id
-        output_path = f"s3://{SILVER_BUCKET_NAME}/processed-batches/{job_id}/{request_id}.parquet"
-
-        final_columns = [
-            'Clothing ID', 'Age', 'Rating', 'Recommended IND', 'Positive Feedback Count',
-            'Division Name', 'Department Name', 'Class Name', 'full_review_text',
-            'sentiment_label', 'sentiment_score'
-        ]
-        df_final = df_cleaned[[col for col in final_columns if col in df_cleaned.columns]]
-        
-        wr.s3.to_parquet(df=df_final, path=output_path, index=False)
-        print(f"Successfully saved batch to {output_path}")
-
-        # --- 4. Atomically update the job status in DynamoDB ---
-        table.update_item(
-            Key={'job_id': job_id},
-            UpdateExpression="ADD processed_batches :inc", # Increment the counter
-            ExpressionAttributeValues={":inc": 1}
+            message_data = json.loads(record['body'])
+            job_id = message_data['job_id']
+            # Messages from older splitters have no chunk_id; fall back to the SQS message id
+            chunk_id = message_data.get('chunk_id', record['messageId'])
+            job_message_ids.setdefault(job_id, []).append(record['messageId'])
+
+            if job_id not in completed_chunks:
+                with timer.stage('dynamodb'):
+                    completed_chunks[job_id] = get_completed_chunks(job_id)
+            if chunk_id in completed_chunks[job_id]:
+                print(f"Chunk {chunk_id} of job {job_id} was already processed, skipping the redelivery.")
+                continue
+
+            chunk_seconds = {}
+            with timer.stage('load', chunk_seconds):
+                df = load_batch(message_data)
+            print(f"Successfully loaded chunk {chunk_id} with {len(df)} rows for job {job_id}.")
+
+            # --- 2. Data Cleaning ---
+            with timer.stage('clean', chunk_seconds):
+                df_cleaned = clean_batch(df)
+            batches.append((record['messageId'], job_id, chunk_id, df_cleaned, chunk_seconds))
+        except Exception as e:
+            print(f"Error reading message {record['messageId']}: {e}")
+            failed_message_ids.append(record['messageId'])
+    print("Data cleaning completed for all batches.")
+
+    # --- 3. AI Analysis over all messages at once ---
+    if batches:
+        df_all = pd.concat(
+            [df_cleaned.assign(_message_id=message_id) for message_id, _, _, df_cleaned, _ in batches],
+            ignore_index=True
         )
-        print(f"Incremented processed_batches counter for job {job_id}.")
+        model_seconds = dict(sentiment_engine.stage_seconds)
+        start = time.perf_counter()
+        labels, scores = score_sentiment(df_all['full_review_text'].tolist())
+        inference_seconds = time.perf_counter() - start
+        df_all['sentiment_label'] = labels
+        df_all['sentiment_score'] = scores
+        timer.count('rows', len(df_all))
+        print(f"Sentiment analysis completed for {len(df_all)} rows.")
+
+        # Split the shared pass into tokenization, model forward and the rest (cache, pooling)
+        model_seconds = {name: seconds - model_seconds[name] for name, seconds in sentiment_engine.stage_seconds.items()}
+        model_seconds['inference_other'] = inference_seconds - sum(model_seconds.values())
+
+        # Each review is encoded once, whatever the number of labels
+        if topic_tagger:
+            start = time.perf_counter()
+            topics, topic_scores = tag_topics(df_all['full_review_text'].tolist())
+            model_seconds['topics'] = time.perf_counter() - start
+            df_all['topic'] = topics
+            df_all['topic_score'] = topic_scores
+            print(f"Topic tagging completed for {len(df_all)} rows.")
+
+        for name, seconds in model_seconds.items():
+            timer.add(name, seconds)
+
+    # --- 4. Save each chunk under its deterministic name and record it exactly once ---
+    for message_id, job_id, chunk_id, df_cleaned, chunk_seconds in batches:
+        try:
+            # Organize outputs in a subfolder named after the job_id; a retry overwrites the same object
+            output_path = f"s3://{SILVER_BUCKET_NAME}/processed-batches/{job_id}/{chunk_id}.parquet"
+            columns = set(df_cleaned.columns) | {'sentiment_label', 'sentiment_score'}
+            if topic_tagger:
+                columns |= {'topic', 'topic_score'}
+            df_chunk = df_all[df_all['_message_id'] == message_id]
+            df_final = df_chunk[[col for col in FINAL_COLUMNS if col in columns]]
+
+            # The chunk's share of the shared inference pass, by rows
+            for name, seconds in model_seconds.items():
+                chunk_seconds[name] = seconds * len(df_chunk) / max(len(df_all), 1)
+
+            with timer.stage('write', chunk_seconds):
+                wr.s3.to_parquet(df=df_final, path=output_path, index=False)
+            print(f"Successfully saved {len(df_final)} rows to {output_path}")
+
+            with timer.stage('dynamodb'):
+                recorded = record_chunk_completed(job_id, chunk_id, chunk_seconds, len(df_final))
+            if recorded:
+                print(f"Recorded chunk {chunk_id} as processed for job {job_id}.")
+            else:
+                print(f"Chunk {chunk_id} of job {job_id} had already been recorded; counter left unchanged.")
+        except Exception as e:
+            print(f"Error saving chunk {chunk_id} of job {job_id}: {e}")
+            failed_message_ids.append(message_id)
+
+    # --- 5. Start the stitch for every job this invocation may have completed ---
+    # Jobs with skipped redeliveries are included so a failed earlier start is retried
+    for job_id, message_ids in job_message_ids.items():
+        try:
+            with timer.stage('dynamodb'):
+                start_stitch_if_complete(table, lambda_client, STITCHER_FUNCTION_NAME, job_id)
+        except Exception as e:
+            print(f"Error starting the Stitcher for job {job_id}: {e}")
+            failed_message_ids.extend(message_ids)
 
-    return {'statusCode': 200, 'body': 'Batch processed successfully!'}
\ No newline at end of file
+    timer.count('messages', len(event['Records']))
+    timer.count('failed_messages', len(set(failed_message_ids)))
+    timer.emit(job_ids=list(job_message_ids))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in dict.fromkeys(failed_message_ids)]}
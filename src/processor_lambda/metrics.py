@@ -0,0 +1,94 @@
+"""
+Lightweight stage timing shared by the Lambdas (each function ships its own copy).
+
+A StageTimer accumulates the seconds spent in named stages of one invocation, prints
+them as a CloudWatch Embedded Metric Format record (CloudWatch turns the log line into
+metrics, no API calls needed), and builds the update clauses that roll the same
+seconds into the job's `stage_seconds` map in DynamoDB.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ReviewLens')
+
+
+class StageTimer:
+    """Times named stages of an invocation; safe to use from worker threads, whose seconds add up."""
+
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Starts a new invocation."""
+        self.seconds = {}
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, record=None):
+        """Times the block as `name`; the seconds are also added to the `record` dict if one is given."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(name, seconds)
+            if record is not None:
+                record[name] = record.get(name, 0.0) + seconds
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def emit(self, **properties):
+        """Prints the invocation's stage seconds and counts as one EMF record."""
+        metrics = {f"{name}_seconds": round(seconds, 6) for name, seconds in self.seconds.items()}
+        metrics['total_seconds'] = round(time.perf_counter() - self.started, 6)
+        definitions = [{'Name': name, 'Unit': 'Seconds'} for name in metrics]
+        definitions += [{'Name': name, 'Unit': 'Count'} for name in self.counts]
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Function']],
+                    'Metrics': definitions
+                }]
+            },
+            'Function': self.function_name,
+            **metrics,
+            **self.counts,
+            **properties  # Searchable in the logs, not metric dimensions (e.g. job_id)
+        }, default=str))
+
+
+def rollup_update(stage_seconds, prefix, counters=None):
+    """
+    Builds the SET clauses that add stage seconds to the job's `stage_seconds` map (as
+    '<prefix>_<stage>') and counters to top-level number attributes. Returns
+    (clauses, names, values) to merge into an update_item call.
+    """
+    clauses, names, values = [], {}, {}
+    for i, (name, seconds) in enumerate(sorted(stage_seconds.items())):
+        clauses.append(f"#stage_seconds.#stage{i} = if_not_exists(#stage_seconds.#stage{i}, :zero) + :stage{i}")
+        names[f"#stage{i}"] = f"{prefix}_{name}"
+        values[f":stage{i}"] = Decimal(str(round(seconds, 6)))
+    for i, (name, value) in enumerate(sorted((counters or {}).items())):
+        clauses.append(f"#counter{i} = if_not_exists(#counter{i}, :zero) + :counter{i}")
+        names[f"#counter{i}"] = name
+        values[f":counter{i}"] = value
+    if stage_seconds:
+        names['#stage_seconds'] = 'stage_seconds'
+    if clauses:
+        values[':zero'] = 0
+    return clauses, names, values
@@ -0,0 +1,125 @@
+"""
+Multi-core inference for the Processor.
+
+Lambda scales vCPUs with memory (up to 6), but a single Python process only keeps
+them busy as far as the model's intra-op threads do. An InferencePool forks worker
+processes after the models are loaded, so every worker shares the weights
+copy-on-write, shards each batch across them and reassembles the results in input
+order.
+
+Lambda has no /dev/shm, so multiprocessing.Pool and Queue (which need POSIX
+semaphores) are not available; each worker talks to the parent over its own Pipe.
+"""
+import multiprocessing
+import os
+import traceback
+
+
+def available_cores():
+    """Returns the number of CPUs this process may run on (the Lambda's vCPUs)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _merge(results):
+    """Concatenates per-shard results shaped like (labels, scores) into one result of the same shape."""
+    return tuple([value for result in results for value in result[i]] for i in range(len(results[0])))
+
+
+class InferencePool:
+    """
+    Runs named inference functions (e.g. SentimentEngine.predict) across forked workers.
+
+    Each function takes a list of texts and returns a tuple of lists aligned with them.
+    Texts are dealt out by length, so every shard gets a similar amount of work; if the
+    function's owner keeps `stage_seconds`, the workers' seconds are averaged back into
+    the parent's copy, which approximates the wall time of the parallel pass.
+
+    The models must be loaded single-threaded (threads=1): thread pools do not survive
+    a fork, and the cores are used by the workers instead.
+    """
+
+    def __init__(self, functions, workers):
+        self.functions = functions
+        self.context = multiprocessing.get_context('fork')
+        self.workers = [self._start_worker() for _ in range(workers)]
+
+    def _start_worker(self):
+        parent_end, child_end = self.context.Pipe()
+        process = self.context.Process(target=self._serve, args=(child_end,), daemon=True)
+        process.start()
+        child_end.close()
+        return process, parent_end
+
+    def _serve(self, connection):
+        """Worker loop: runs (name, texts) requests until the parent goes away."""
+        while True:
+            try:
+                name, texts = connection.recv()
+            except EOFError:
+                return
+            try:
+                function = self.functions[name]
+                stage_seconds = getattr(getattr(function, '__self__', None), 'stage_seconds', None)
+                before = dict(stage_seconds or {})
+                result = function(texts)
+                seconds = {key: value - before.get(key, 0.0) for key, value in (stage_seconds or {}).items()}
+                connection.send((True, result, seconds))
+            except Exception:
+                connection.send((False, traceback.format_exc(), None))
+
+    def _replace_dead_workers(self):
+        for i, (process, connection) in enumerate(self.workers):
+            if not process.is_alive():
+                print(f"Inference worker {process.pid} exited with code {process.exitcode}; starting a new one.")
+                connection.close()
+                self.workers[i] = self._start_worker()
+
+    def run(self, name, texts):
+        """Runs the named function over the texts, sharded across the workers, and returns the merged result."""
+        texts = list(texts)
+        if len(texts) < 2 or len(self.workers) < 2:
+            return self.functions[name](texts)
+        self._replace_dead_workers()
+
+        # 1. Deal the texts out by length, so the shards cost about the same
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        shards = [order[i::len(self.workers)] for i in range(min(len(self.workers), len(texts)))]
+        for (_, connection), shard in zip(self.workers, shards):
+            connection.send((name, [texts[i] for i in shard]))
+
+        # 2. Collect every reply before raising, so no answer is left in a pipe
+        replies, errors = [], []
+        for process, connection in self.workers[:len(shards)]:
+            try:
+                replies.append(connection.recv())
+            except EOFError:
+                replies.append((False, f"Inference worker {process.pid} died", None))
+        for ok, result, _ in replies:
+            if not ok:
+                errors.append(result)
+        if errors:
+            raise RuntimeError(f"Inference failed in {len(errors)} worker(s):\n{errors[0]}")
+
+        # 3. Put the results back in input order and fold in the workers' stage seconds
+        merged = _merge([result for _, result, _ in replies])
+        positions = [i for shard in shards for i in shard]
+        ordered = tuple([None] * len(texts) for _ in merged)
+        for values, column in zip(merged, ordered):
+            for position, value in zip(positions, values):
+                column[position] = value
+
+        stage_seconds = getattr(getattr(self.functions[name], '__self__', None), 'stage_seconds', None)
+        if stage_seconds is not None:
+            for _, _, seconds in replies:
+                for key, value in seconds.items():
+                    stage_seconds[key] = stage_seconds.get(key, 0.0) + value / len(replies)
+        return ordered
+
+    def close(self):
+        for process, connection in self.workers:
+            connection.close()
+            process.join(timeout=5)
+        self.workers = []
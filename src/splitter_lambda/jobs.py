@@ -0,0 +1,54 @@
+"""
+Job status transitions shared by the Lambdas (each function ships its own copy).
+
+Both the Splitter and the Processor may be the one that sees a job's last batch
+processed, so both start the stitch; keeping the transition in one place keeps the
+two callers from drifting apart.
+"""
+import json
+import time
+
+
+def start_stitch_if_complete(table, lambda_client, stitcher_function_name, job_id):
+    """
+    Moves a job from IN_PROGRESS to STITCH_QUEUED once every batch is processed and starts
+    the Stitcher asynchronously. The conditional transition succeeds for exactly one caller,
+    so the stitch starts once no matter how many invocations finish at the same time. The
+    stitch_queued_at timestamp lets the status checker spot a start that was lost. If the
+    Stitcher cannot be started, the job is handed back to IN_PROGRESS (keeping the timestamp)
+    and the error re-raised. Returns True if this caller started the stitch.
+    """
+    if not stitcher_function_name:
+        return False
+    try:
+        table.update_item(
+            Key={'job_id': job_id},
+            UpdateExpression="SET #st = :queued, stitch_queued_at = :now",
+            ConditionExpression="#st = :in_progress AND processed_batches >= total_batches",
+            ExpressionAttributeNames={'#st': 'status'},
+            ExpressionAttributeValues={':queued': 'STITCH_QUEUED', ':in_progress': 'IN_PROGRESS', ':now': int(time.time())}
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+
+    try:
+        lambda_client.invoke(
+            FunctionName=stitcher_function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'job_id': job_id})
+        )
+    except Exception:
+        # Hand the transition back, unless a Stitcher has picked the job up in the meantime
+        try:
+            table.update_item(
+                Key={'job_id': job_id},
+                UpdateExpression="SET #st = :in_progress",
+                ConditionExpression="#st = :queued",
+                ExpressionAttributeNames={'#st': 'status'},
+                ExpressionAttributeValues={':in_progress': 'IN_PROGRESS', ':queued': 'STITCH_QUEUED'}
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+        raise
+    print(f"All batches of job {job_id} are processed; started the Stitcher.")
+    return True
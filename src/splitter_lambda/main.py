@@ -1,28 +1,367 @@
 import os
+import io
+import csv
 import boto3
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import json
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from metrics import StageTimer, rollup_update
+from jobs import start_stitch_if_complete
 
 # Retrieve environment variables set by Terraform
 SQS_QUEUE_URL = os.environ['SQS_QUEUE_URL']
 DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_TABLE_NAME']
-BATCH_SIZE = 200  # Number of rows per SQS message/batch
+# 'inline' ships each chunk as JSON in the SQS body; 'claim_check' stages it as an Arrow file
+# in S3 and only ships a pointer, which lifts the 256 KB message cap on the chunk size
+PAYLOAD_MODE = os.environ.get('PAYLOAD_MODE', 'inline')
+STAGING_BUCKET_NAME = os.environ.get('STAGING_BUCKET_NAME')
+STITCHER_FUNCTION_NAME = os.environ.get('STITCHER_FUNCTION_NAME')  # Started automatically when a job completes
+STAGING_PREFIX = 'staging'
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 2000 if PAYLOAD_MODE == 'claim_check' else 200))  # Rows per batch
+# Streamed chunks are sized by estimated model tokens rather than rows, so a chunk of
+# essays costs the Processor about as much as a chunk of one-liners (0 = BATCH_SIZE rows)
+CHUNK_TOKEN_BUDGET = int(os.environ.get('CHUNK_TOKEN_BUDGET', BATCH_SIZE * 100))
+CHUNK_MIN_ROWS = int(os.environ.get('CHUNK_MIN_ROWS', max(1, BATCH_SIZE // 8)))
+CHUNK_MAX_ROWS = int(os.environ.get('CHUNK_MAX_ROWS', BATCH_SIZE * 4))
+CHARS_PER_TOKEN = float(os.environ.get('CHARS_PER_TOKEN', 4.0))  # See benchmarks/calibrate_tokens.py
+MAX_TOKENS_PER_REVIEW = int(os.environ.get('MAX_TOKENS_PER_REVIEW', 512))  # Model window; 0 if long reviews are chunked
+# Inline chunks travel in the SQS body, so they are also capped by their JSON size (the limit
+# is 256 KB; the rest is left for the message envelope and the 'split' layout's overhead)
+INLINE_MAX_CHUNK_BYTES = int(os.environ.get('INLINE_MAX_CHUNK_BYTES', 200 * 1024))
+# 'stream' reads the whole file here; 'ranges' only plans row-aligned byte ranges and lets
+# each Processor read its own range straight from S3
+SPLIT_MODE = os.environ.get('SPLIT_MODE', 'stream')
+RANGE_SIZE_BYTES = int(os.environ.get('RANGE_SIZE_BYTES', 2 * 1024 * 1024))  # Target bytes per range work item
+PROBE_BYTES = 64 * 1024  # Bytes read around each tentative range boundary
+PROBE_RECORDS = 3  # Complete records that must parse cleanly after a candidate boundary
+SQS_MAX_BATCH_ENTRIES = 10  # Hard limits of SendMessageBatch: 10 entries...
+SQS_MAX_BATCH_BYTES = 256 * 1024  # ...and 256 KB of message bodies per call
+SQS_SEND_CONCURRENCY = int(os.environ.get('SQS_SEND_CONCURRENCY', 8))  # In-flight SendMessageBatch calls
+SEND_BACKLOG_ROWS = int(os.environ.get('SEND_BACKLOG_ROWS', 40000))  # Rows read but not yet sent, held in memory
+SQS_SEND_ATTEMPTS = 3
+# Canonical schema the rest of the pipeline works with. Only these columns are parsed and
+# shipped; the upload's column_mapping says which source column provides each of them.
+CANONICAL_COLUMNS = [
+    'Clothing ID', 'Age', 'Title', 'Review Text', 'Rating', 'Recommended IND',
+    'Positive Feedback Count', 'Division Name', 'Department Name', 'Class Name'
+]
+NUMERIC_COLUMNS = {'Age': 'Int64', 'Rating': 'float64', 'Recommended IND': 'Int64', 'Positive Feedback Count': 'Int64'}
+# Compressed uploads (e.g. 'reviews.csv.gz' from the dashboard) are decompressed while streaming
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.gzip': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+CONTENT_ENCODINGS = {'gzip': 'gzip', 'x-gzip': 'gzip', 'zstd': 'zstd'}
 
 # Initialize AWS clients outside the handler for performance (reused in warm starts)
 s3_client = boto3.client('s3')
 sqs_client = boto3.client('sqs')
+lambda_client = boto3.client('lambda')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+timer = StageTimer('splitter')  # Stages run on the send threads too, so their seconds can exceed wall time
+
+def get_column_renames(metadata):
+    """
+    Reads the dashboard's column_mapping ({canonical: source}) from the object metadata and
+    returns {source: canonical} for every column to keep. Canonical columns without a
+    mapping are kept when the file has them under their canonical name.
+    """
+    # Some S3 front ends normalize the underscore in metadata keys to a hyphen
+    raw_mapping = metadata.get('column_mapping') or metadata.get('column-mapping') or '{}'
+    try:
+        mapping = json.loads(raw_mapping)
+    except json.JSONDecodeError:
+        print(f"Ignoring invalid column_mapping metadata: {raw_mapping}")
+        mapping = {}
+    mapping = {canonical: source for canonical, source in mapping.items() if canonical in CANONICAL_COLUMNS and source}
+    renames = {canonical: canonical for canonical in CANONICAL_COLUMNS if canonical not in mapping}
+    renames.update({source: canonical for canonical, source in mapping.items()})
+    return renames
+
+def detect_compression(file_key, content_encoding=None):
+    """Returns the codec of a compressed upload ('gzip' or 'zstd'), from its key suffix or ContentEncoding; None for plain CSV."""
+    for suffix, codec in COMPRESSION_SUFFIXES.items():
+        if file_key.lower().endswith(suffix):
+            return codec
+    return CONTENT_ENCODINGS.get((content_encoding or '').strip().lower())
+
+def normalize_chunk(chunk, renames):
+    """
+    Renames a chunk (read with every column as text) to the canonical schema, coerces the
+    numeric columns so every chunk has the same types, and drops rows without review text.
+    """
+    chunk = chunk.rename(columns=renames)
+    if 'Review Text' not in chunk.columns:
+        raise ValueError("No review text column found; check the upload's column mapping.")
+    for column, dtype in NUMERIC_COLUMNS.items():
+        if column in chunk.columns:
+            values = pd.to_numeric(chunk[column], errors='coerce')
+            chunk[column] = values.round().astype(dtype) if dtype == 'Int64' else values.astype(dtype)
+    has_text = chunk['Review Text'].notna() & (chunk['Review Text'].str.strip() != '')
+    return chunk[has_text].reset_index(drop=True)
+
+def estimate_tokens(chunk):
+    """Estimates the model tokens of every row from the length of the text the Processor scores."""
+    chars = chunk['Review Text'].str.len()
+    if 'Title' in chunk.columns:
+        chars = chars + chunk['Title'].fillna('').str.len() + 1
+    tokens = np.ceil(chars.to_numpy(dtype=np.float64) / CHARS_PER_TOKEN) + 2  # Plus the special tokens
+    if MAX_TOKENS_PER_REVIEW:
+        tokens = np.minimum(tokens, MAX_TOKENS_PER_REVIEW)  # The Processor truncates the rest
+    return tokens
+
+def estimate_json_bytes(chunk):
+    """
+    Returns the size of every row in an inline message body: the row as a JSON record
+    (larger than in the 'split' layout), escaped again as it is inside the message's JSON.
+    """
+    lines = chunk.to_json(orient='records', lines=True).splitlines()
+    return np.array([len(json.dumps(line)) for line in lines], dtype=np.float64)
+
+def pack_by_token_budget(chunks, max_bytes=None):
+    """
+    Regroups normalized chunks into chunks of about CHUNK_TOKEN_BUDGET estimated tokens.
+    A chunk is closed once it reaches the budget with at least CHUNK_MIN_ROWS rows, or
+    when it reaches CHUNK_MAX_ROWS rows; the last one holds whatever is left. With
+    max_bytes, a chunk is also closed before its rows' JSON would exceed that size, even
+    below CHUNK_MIN_ROWS: the token estimate is capped per review, the text is not.
+    """
+    parts, rows, tokens, size = [], 0, 0.0, 0.0
+    for chunk in chunks:
+        chunk_tokens = estimate_tokens(chunk)
+        chunk_bytes = estimate_json_bytes(chunk) if max_bytes else None
+        start = 0
+        while start < len(chunk):
+            # Running totals of the pending chunk over the rows that still fit in it
+            cumulative = tokens + np.cumsum(chunk_tokens[start:start + CHUNK_MAX_ROWS - rows])
+            end = max(int(np.searchsorted(cumulative, CHUNK_TOKEN_BUDGET)), CHUNK_MIN_ROWS - rows - 1) + 1
+            full = end <= len(cumulative) or rows + len(cumulative) == CHUNK_MAX_ROWS
+            end = min(end, len(cumulative))
+            if max_bytes:
+                cumulative_bytes = size + np.cumsum(chunk_bytes[start:start + end])
+                fits = int(np.searchsorted(cumulative_bytes, max_bytes, side='right'))
+                if fits < end:
+                    # A single oversized row still goes alone rather than blocking the stream
+                    end, full = max(fits, 0 if rows else 1), True
+                if end:
+                    size = cumulative_bytes[end - 1]
+            if end:
+                parts.append(chunk.iloc[start:start + end])
+                rows, tokens = rows + end, cumulative[end - 1]
+                start += end
+            if full:
+                yield pd.concat(parts, ignore_index=True)
+                parts, rows, tokens, size = [], 0, 0.0, 0.0
+    if parts:
+        yield pd.concat(parts, ignore_index=True)
+
+def make_chunk_id(chunk_num):
+    """Deterministic id of a chunk within its job; the Processor uses it to make retries no-ops."""
+    return f"{chunk_num:06d}"
+
+def stage_chunk(job_id, chunk_num, chunk):
+    """Writes a chunk as an uncompressed Arrow IPC file (readable zero-copy) and returns its S3 URI."""
+    key = f"{STAGING_PREFIX}/{job_id}/{make_chunk_id(chunk_num)}.arrow"
+    arrow_table = pa.Table.from_pandas(chunk, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    s3_client.put_object(Bucket=STAGING_BUCKET_NAME, Key=key, Body=sink.getvalue().to_pybytes())
+    return f"s3://{STAGING_BUCKET_NAME}/{key}"
+
+def build_message(job_id, chunk_num, chunk):
+    """Builds the SQS body for one chunk, either with the rows inline or with a claim-check pointer."""
+    message_data = {'job_id': job_id, 'chunk_id': make_chunk_id(chunk_num)}
+    if PAYLOAD_MODE == 'claim_check':
+        with timer.stage('stage'):
+            message_data['payload_uri'] = stage_chunk(job_id, chunk_num, chunk)
+    else:
+        with timer.stage('serialize'):
+            message_data['data'] = chunk.to_json(orient='split')
+    return json.dumps(message_data)
+
+def send_chunks(job_id, chunks):
+    """Builds the messages for up to 10 numbered chunks and sends them."""
+    send_messages([(chunk_num, build_message(job_id, chunk_num, chunk)) for chunk_num, chunk in chunks])
+
+def send_messages(messages):
+    """
+    Sends up to 10 numbered message bodies with as few SendMessageBatch calls
+    as the 10-entry / 256 KB limits allow.
+    """
+    entries, entries_bytes = [], 0
+    for chunk_num, message_body in messages:
+        message_bytes = len(message_body.encode('utf-8'))
+        if entries and entries_bytes + message_bytes > SQS_MAX_BATCH_BYTES:
+            send_batch(entries)
+            entries, entries_bytes = [], 0
+        entries.append({'Id': str(chunk_num), 'MessageBody': message_body})
+        entries_bytes += message_bytes
+    if entries:
+        send_batch(entries)
+
+def send_batch(entries):
+    """Sends up to 10 messages in one call, retrying only the entries SQS rejected."""
+    for attempt in range(SQS_SEND_ATTEMPTS):
+        with timer.stage('enqueue'):
+            response = sqs_client.send_message_batch(QueueUrl=SQS_QUEUE_URL, Entries=entries)
+        failed_ids = {failure['Id'] for failure in response.get('Failed', [])}
+        if not failed_ids:
+            return
+        entries = [entry for entry in entries if entry['Id'] in failed_ids]
+        print(f"Retrying {len(entries)} rejected messages (attempt {attempt + 1})...")
+    raise RuntimeError(f"SQS rejected {len(entries)} messages after {SQS_SEND_ATTEMPTS} attempts.")
+
+def find_record_end(data, start=0):
+    """
+    Returns the offset just past the first newline at or after `start` that is outside a
+    quoted field, assuming `start` is itself at a record boundary. None if there is none.
+    """
+    in_quotes = False
+    for offset in range(start, len(data)):
+        char = data[offset]
+        if char == 0x22:  # '"' (a doubled quote toggles twice, so escapes need no special case)
+            in_quotes = not in_quotes
+        elif char == 0x0A and not in_quotes:  # '\n'
+            return offset + 1
+    return None
+
+def looks_like_record_start(data, field_count):
+    """
+    Checks that the bytes following a candidate boundary parse as whole CSV records.
+    A newline inside a quoted review shifts the quoting, so the records that follow
+    it come out with the wrong number of fields.
+    """
+    text = data.decode('utf-8', errors='replace')
+    records = list(csv.reader(io.StringIO(text)))
+    # The last record may be cut off by the end of the probe window
+    complete = records[:-1] if len(records) > 1 else []
+    return bool(complete) and all(len(record) == field_count for record in complete[:PROBE_RECORDS])
+
+def find_range_boundary(bucket_name, file_key, offset, field_count):
+    """Returns the first row boundary at or after `offset`, or None if the probe window has none."""
+    probe = s3_client.get_object(
+        Bucket=bucket_name, Key=file_key, Range=f"bytes={offset}-{offset + PROBE_BYTES - 1}"
+    )['Body'].read()
+    position = probe.find(b'\n')
+    while position != -1:
+        candidate = position + 1
+        if looks_like_record_start(probe[candidate:], field_count):
+            return offset + candidate
+        position = probe.find(b'\n', candidate)
+    return None
+
+def plan_byte_ranges(bucket_name, file_key):
+    """
+    HEADs the object, reads its header, and probes a small window at every RANGE_SIZE_BYTES
+    step to find the row boundaries. Returns the column names and the (start, end) ranges.
+    """
+    size = s3_client.head_object(Bucket=bucket_name, Key=file_key)['ContentLength']
+    head = s3_client.get_object(Bucket=bucket_name, Key=file_key, Range=f"bytes=0-{PROBE_BYTES - 1}")['Body'].read()
+    data_start = find_record_end(head)
+    if data_start is None:
+        raise ValueError("Could not find the end of the CSV header in the first probe window.")
+    header = next(csv.reader(io.StringIO(head[:data_start].decode('utf-8-sig'))))
+    # Match pandas' naming of unnamed columns (e.g. an exported index)
+    columns = [name or f"Unnamed: {i}" for i, name in enumerate(header)]
+
+    tentative = range(data_start + RANGE_SIZE_BYTES, size, RANGE_SIZE_BYTES)
+    with ThreadPoolExecutor(max_workers=SQS_SEND_CONCURRENCY) as executor:
+        found = executor.map(lambda offset: find_range_boundary(bucket_name, file_key, offset, len(columns)), tentative)
+        boundaries = sorted({boundary for boundary in found if boundary is not None and boundary < size})
+
+    # A boundary without a clean row start is dropped, which merges its range into the previous one
+    edges = [data_start] + boundaries + [size]
+    ranges = [(start, end) for start, end in zip(edges, edges[1:]) if end > start]
+    return columns, ranges
+
+def split_by_ranges(job_id, bucket_name, file_key, renames):
+    """
+    Sends one work item per row-aligned byte range and returns the number of items sent.
+    Each item carries the read options (columns to parse and their canonical names) so
+    the Processor applies the same projection as the streaming path.
+    """
+    with timer.stage('plan'):
+        columns, ranges = plan_byte_ranges(bucket_name, file_key)
+    print(f"Planned {len(ranges)} byte ranges for s3://{bucket_name}/{file_key}.")
+    renames = {column: renames[column] for column in columns if column in renames}
+    messages = []
+    for chunk_num, (start, end) in enumerate(ranges, start=1):
+        message_data = {
+            'job_id': job_id,
+            'chunk_id': make_chunk_id(chunk_num),
+            'source': {
+                'bucket': bucket_name, 'key': file_key, 'start': start, 'end': end,
+                'columns': columns, 'renames': renames
+            }
+        }
+        messages.append((chunk_num, json.dumps(message_data)))
+    with ThreadPoolExecutor(max_workers=SQS_SEND_CONCURRENCY) as executor:
+        groups = [messages[i:i + SQS_MAX_BATCH_ENTRIES] for i in range(0, len(messages), SQS_MAX_BATCH_ENTRIES)]
+        for _ in executor.map(send_messages, groups):
+            pass  # Iterating re-raises any send failure
+    return len(ranges)
+
+def split_by_stream(job_id, bucket_name, file_key, renames, compression=None):
+    """
+    Streams the S3 object once (decompressing it on the way if needed), parsing only the
+    mapped columns, packs the rows into chunks by estimated token budget, and hands
+    chunks off as soon as a full SendMessageBatch is ready. Returns the number of chunks sent.
+    """
+    s3_object = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+    body = s3_object['Body']
+    if compression:
+        body = pa.CompressedInputStream(pa.PythonFile(body, mode='r'), compression)
+    read_rows = CHUNK_MAX_ROWS if CHUNK_TOKEN_BUDGET else BATCH_SIZE
+    chunk_num = 0
+    pending = []
+    with ThreadPoolExecutor(max_workers=SQS_SEND_CONCURRENCY) as executor:
+        futures, backlog_rows = [], 0
+        with pd.read_csv(body, chunksize=read_rows, usecols=lambda column: column in renames, dtype=str) as csv_iterator:
+            chunks = (normalize_chunk(chunk, renames) for chunk in csv_iterator)
+            if CHUNK_TOKEN_BUDGET:
+                chunks = pack_by_token_budget(chunks, INLINE_MAX_CHUNK_BYTES if PAYLOAD_MODE == 'inline' else None)
+            while True:
+                with timer.stage('read'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if chunk.empty:
+                    continue  # Nothing usable in this part of the file
+                chunk_num += 1
+                timer.count('rows', len(chunk))
+                pending.append((chunk_num, chunk))
+
+                # Serialize or stage the chunks and send them in the background
+                if len(pending) == SQS_MAX_BATCH_ENTRIES:
+                    rows = sum(len(pending_chunk) for _, pending_chunk in pending)
+                    futures.append((executor.submit(send_chunks, job_id, pending), rows))
+                    backlog_rows += rows
+                    pending = []
+                    # Bound the rows held in memory (chunk sizes vary a lot) and the queued batches
+                    while futures and (backlog_rows > SEND_BACKLOG_ROWS or len(futures) >= SQS_SEND_CONCURRENCY * 2):
+                        future, rows = futures.pop(0)
+                        future.result()
+                        backlog_rows -= rows
+        if pending:
+            futures.append((executor.submit(send_chunks, job_id, pending), 0))
+        for future, _ in futures:
+            future.result()  # Re-raises any send failure
+    return chunk_num
 
 def handler(event, context):
     """
-    This function is triggered by an S3 upload. It reads a CSV file in chunks,
-    sends each chunk as a message to an SQS queue, and creates a record
-    in DynamoDB to track the job's status.
+    This function is triggered by an S3 upload. It streams the CSV file once in chunks,
+    sends the chunks (inline, or as pointers to staged Arrow files) to an SQS queue in
+    batches of up to 10 messages, and tracks the job's status in DynamoDB. The total
+    number of batches is recorded once the file is done. In 'ranges' mode it only plans
+    row-aligned byte ranges and enqueues those instead of reading the file. gzip and
+    zstd uploads are decompressed while streaming.
     """
     print("Splitter handler started...")
-    
+    timer.reset()
+
     # 1. Get file information from the S3 trigger event
     bucket_name = event['Records'][0]['s3']['bucket']['name']
     file_key = event['Records'][0]['s3']['object']['key']
@@ -33,52 +372,51 @@ def handler(event, context):
     print(f"Generated new Job ID: {job_id}")
 
     try:
-        # 3. Read the file once to count total rows and calculate total chunks
-        s3_object = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-        row_count = 0
-        # Use a chunksize iterator to avoid loading the entire file into memory
-        with pd.read_csv(s3_object['Body'], chunksize=BATCH_SIZE) as csv_iterator:
-            for chunk in csv_iterator:
-                row_count += len(chunk)
-        total_chunks = -(-row_count // BATCH_SIZE)  # Ceiling division
-        
-        print(f"File has {row_count} rows, which will be split into {total_chunks} chunks.")
-
-        # --- 4. Create the job entry in the DynamoDB table ---
-        table.put_item(
-            Item={
-                'job_id': job_id,
-                'status': 'IN_PROGRESS',
-                'total_batches': total_chunks,
-                'processed_batches': 0,
-                'source_file': f"s3://{bucket_name}/{file_key}"
-            }
-        )
+        # --- 3. Create the job entry in the DynamoDB table ---
+        # The batch count is unknown until the file has been read, so the job starts as SPLITTING
+        with timer.stage('dynamodb'):
+            table.put_item(
+                Item={
+                    'job_id': job_id,
+                    'status': 'SPLITTING',
+                    'processed_batches': 0,
+                    'rows_processed': 0,
+                    'stage_seconds': {},  # Per-stage totals, e.g. 'processor_forward', rolled up by every function
+                    'source_file': f"s3://{bucket_name}/{file_key}"
+                }
+            )
         print(f"Job {job_id} registered in DynamoDB.")
 
-        # 5. Re-read the S3 object to stream and send messages
-        s3_object = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-        csv_iterator = pd.read_csv(s3_object['Body'], chunksize=BATCH_SIZE)
-        
-        chunk_num = 0
-        for chunk in csv_iterator:
-            chunk_num += 1
-            print(f"Sending chunk #{chunk_num}...")
-
-            # --- 6. Add the job_id to each message for tracking ---
-            message_data = {
-                'job_id': job_id,
-                'data': chunk.to_json(orient='split')
-            }
-            
-            sqs_client.send_message(
-                QueueUrl=SQS_QUEUE_URL,
-                MessageBody=json.dumps(message_data)
-            )
-        
+        # 4. Either fan out row-aligned byte ranges or stream the file through this function,
+        #    keeping only the columns the upload's mapping points at
+        head = s3_client.head_object(Bucket=bucket_name, Key=file_key)
+        renames = get_column_renames(head.get('Metadata', {}))
+        compression = detect_compression(file_key, head.get('ContentEncoding'))
+        print(f"Reading columns as: {renames} (compression: {compression})")
+        if SPLIT_MODE == 'ranges' and not compression:
+            chunk_num = split_by_ranges(job_id, bucket_name, file_key, renames)
+        else:
+            # Compressed bytes cannot be split into independently readable ranges
+            chunk_num = split_by_stream(job_id, bucket_name, file_key, renames, compression)
+
         print(f"Successfully sent {chunk_num} messages to SQS for job {job_id}.")
+
+        # --- 5. Record the final batch count and this function's stage totals now that the file has been read ---
+        # Row counts are only known when the file was streamed through this function
+        counters = {'rows_total': timer.counts['rows']} if 'rows' in timer.counts else {}
+        clauses, names, values = rollup_update(timer.seconds, 'splitter', counters)
+        table.update_item(
+            Key={'job_id': job_id},
+            UpdateExpression="SET " + ", ".join(["total_batches = :t", "#st = :s"] + clauses),
+            ExpressionAttributeNames={'#st': 'status', **names},
+            ExpressionAttributeValues={':t': chunk_num, ':s': 'IN_PROGRESS', **values}
+        )
+        print(f"Job {job_id} has {chunk_num} batches in total.")
+        start_stitch_if_complete(table, lambda_client, STITCHER_FUNCTION_NAME, job_id)
+        timer.count('batches', chunk_num)
+        timer.emit(job_id=job_id)
         return {'statusCode': 200, 'body': f'Job {job_id} started with {chunk_num} batches.'}
 
     except Exception as e:
         print(f"Error in Splitter Lambda: {e}")
-        raise e
\ No newline at end of file
+        raise e
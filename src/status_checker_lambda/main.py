@@ -1,7 +1,10 @@
 import os
 import json
+import time
+import hashlib
 import boto3
 from decimal import Decimal
+from metrics import StageTimer
 
 # Helper class to serialize DynamoDB's Decimal type into float for JSON responses
 class DecimalEncoder(json.JSONEncoder):
@@ -12,60 +15,173 @@ class DecimalEncoder(json.JSONEncoder):
 
 # Initialize DynamoDB client
 DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_TABLE_NAME']
+MAX_WAIT_SECONDS = int(os.environ.get('MAX_WAIT_SECONDS', 20))  # Long-poll cap, below the API Gateway timeout
+POLL_INTERVAL_SECONDS = float(os.environ.get('POLL_INTERVAL_SECONDS', 1))  # DynamoDB re-read interval while waiting
+MAX_JOBS_PER_REQUEST = 100  # BatchGetItem limit
+STITCH_TIMEOUT_SECONDS = int(os.environ.get('STITCH_TIMEOUT_SECONDS', 900))  # The Stitcher's function timeout
+STITCH_QUEUE_TIMEOUT_SECONDS = int(os.environ.get('STITCH_QUEUE_TIMEOUT_SECONDS', 300))  # Queued stitch that never started
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+timer = StageTimer('status_checker')
+
+# Only the attributes the status view needs; the completed chunk set can be large and is never read
+STATUS_ATTRIBUTES = [
+    'job_id', 'status', 'processed_batches', 'total_batches', 'source_file',
+    'stage_seconds', 'rows_processed', 'rows_total', 'stitch_queued_at', 'stitch_claimed_at'
+]
+PROJECTION = ', '.join(f"#a{i}" for i in range(len(STATUS_ATTRIBUTES)))
+PROJECTION_NAMES = {f"#a{i}": name for i, name in enumerate(STATUS_ATTRIBUTES)}
+
+def get_jobs(job_ids):
+    """Returns {job_id: item} for the jobs that exist, with a single read for one job or BatchGetItem for many."""
+    if len(job_ids) == 1:
+        response = table.get_item(
+            Key={'job_id': job_ids[0]},
+            ProjectionExpression=PROJECTION,
+            ExpressionAttributeNames=PROJECTION_NAMES
+        )
+        return {job_ids[0]: response['Item']} if 'Item' in response else {}
+
+    items = {}
+    request = {DYNAMODB_TABLE_NAME: {
+        'Keys': [{'job_id': job_id} for job_id in job_ids],
+        'ProjectionExpression': PROJECTION,
+        'ExpressionAttributeNames': PROJECTION_NAMES
+    }}
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response['Responses'].get(DYNAMODB_TABLE_NAME, []):
+            items[item['job_id']] = item
+        request = response.get('UnprocessedKeys')
+    return items
+
+def build_status(item):
+    """Calculates progress and determines the reported status of one job item."""
+    total = item.get('total_batches', 0)
+    processed = item.get('processed_batches', 0)
+
+    if total > 0:
+        item['progress_percentage'] = round((processed / total) * 100, 2)
+    else:
+        item['progress_percentage'] = 0
+
+    # If processing is complete, update the status field for clarity
+    if processed >= total and item.get('status') == 'IN_PROGRESS':
+        item['status'] = 'PROCESSING_COMPLETE'
+
+    # A stitch claimed longer ago than the Stitcher's timeout died without reporting, a queued
+    # one that never started was lost (e.g. throttled past the async retries), and a job handed
+    # back after a failed start waits for a trigger that may never come; all can be retried
+    queued_at = item.get('stitch_queued_at')
+    if item.get('status') == 'STITCHING':
+        claimed_at = item.get('stitch_claimed_at')
+        item['stitch_stale'] = claimed_at is None or time.time() - float(claimed_at) > STITCH_TIMEOUT_SECONDS
+    elif item.get('status') == 'STITCH_QUEUED':
+        item['stitch_stale'] = queued_at is None or time.time() - float(queued_at) > STITCH_QUEUE_TIMEOUT_SECONDS
+    elif item.get('status') == 'PROCESSING_COMPLETE' and queued_at is not None:
+        item['stitch_stale'] = True
+
+    # Summarize the per-stage seconds every function rolled into the job
+    stage_seconds = item.get('stage_seconds')
+    if stage_seconds:
+        function_seconds = {}
+        for name, seconds in stage_seconds.items():
+            function = name.split('_', 1)[0]
+            function_seconds[function] = function_seconds.get(function, 0) + seconds
+        processor_seconds = function_seconds.get('processor', 0)
+        item['timings'] = {
+            'function_seconds': function_seconds,
+            'slowest_stage': max(stage_seconds, key=stage_seconds.get),
+            'processor_rows_per_second': round(item.get('rows_processed', 0) / processor_seconds, 2) if processor_seconds else None
+        }
+    return item
+
+def render(job_ids, multi):
+    """Returns (body, etag) for the current state of the requested jobs."""
+    with timer.stage('dynamodb'):
+        jobs = get_jobs(job_ids)
+    items = {job_id: build_status(item) for job_id, item in jobs.items()}
+    if multi:
+        view = {'jobs': items, 'missing': [job_id for job_id in job_ids if job_id not in items]}
+    else:
+        view = items.get(job_ids[0])
+    if view is None:
+        return None, None
+    body = json.dumps(view, cls=DecimalEncoder, sort_keys=True)
+    return body, f'"{hashlib.sha1(body.encode()).hexdigest()[:20]}"'
 
 def handler(event, context):
     """
-    This function is triggered by API Gateway. It reads a job_id from the URL path
-    and returns the current status of that job from the DynamoDB table.
+    This function is triggered by API Gateway. It returns the current status of one job
+    (GET /status/{job_id}) or of many jobs in a single BatchGetItem (GET /status?job_ids=a,b).
+
+    Every response carries an ETag. A client that sends it back in If-None-Match (or as
+    ?since=) gets a 304 while nothing has changed, and with ?wait=<seconds> the request is
+    held open, re-reading the job every POLL_INTERVAL_SECONDS, until the status changes or
+    the wait runs out.
     """
     print(f"Status-Checker handler started with event: {event}")
-    
+    timer.reset()
+
     try:
-        # 1. Get the job_id from the API Gateway path parameters
-        job_id = event['pathParameters']['job_id']
-        print(f"Checking status for job_id: {job_id}")
-        
-        # 2. Query the DynamoDB table for the specific job item
-        response = table.get_item(
-            Key={'job_id': job_id}
-        )
-        
-        item = response.get('Item')
-        
+        # 1. Get the job ids from the path or the query string, and the long-poll parameters
+        params = event.get('queryStringParameters') or {}
+        headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+        path_job_id = (event.get('pathParameters') or {}).get('job_id')
+        multi = path_job_id is None
+        job_ids = [path_job_id] if not multi else list(dict.fromkeys(
+            job_id for job_id in params.get('job_ids', '').split(',') if job_id
+        ))
+        if not job_ids or len(job_ids) > MAX_JOBS_PER_REQUEST:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': f'Provide a job_id in the path or 1-{MAX_JOBS_PER_REQUEST} comma-separated job_ids.'})
+            }
+        known_etag = headers.get('if-none-match') or params.get('since')
+        try:
+            wait = float(params.get('wait') or 0)
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'wait must be a number of seconds.'})
+            }
+        wait = max(0.0, min(wait, MAX_WAIT_SECONDS))
+        print(f"Checking status for job_ids: {job_ids} (wait={wait}s)")
+
+        # 2. Read the jobs, and while the client already has this version, wait for a change
+        deadline = time.monotonic() + wait
+        body, etag = render(job_ids, multi)
+        while etag is not None and etag == known_etag and time.monotonic() + POLL_INTERVAL_SECONDS < deadline:
+            with timer.stage('wait'):
+                time.sleep(POLL_INTERVAL_SECONDS)
+            body, etag = render(job_ids, multi)
+        timer.count('jobs', len(job_ids))
+        timer.emit(job_ids=job_ids, changed=etag != known_etag)
+
         # 3. If the job is not found, return a 404 Not Found error
-        if not item:
-            print(f"Job with id {job_id} not found.")
+        if body is None:
+            print(f"Job with id {job_ids[0]} not found.")
             return {
                 'statusCode': 404,
-                'body': json.dumps({'error': f'Job {job_id} not found'})
+                'body': json.dumps({'error': f'Job {job_ids[0]} not found'})
             }
 
-        # 4. If found, calculate progress and determine the final status
-        total = item.get('total_batches', 0)
-        processed = item.get('processed_batches', 0)
-        
-        if total > 0:
-            item['progress_percentage'] = round((processed / total) * 100, 2)
-        else:
-            item['progress_percentage'] = 0
-            
-        # If processing is complete, update the status field for clarity
-        if processed >= total and item.get('status') == 'IN_PROGRESS':
-            item['status'] = 'PROCESSING_COMPLETE'
-
-        print(f"Job status found: {item}")
-        
+        # 4. Nothing changed since the client's version: answer without a body
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag == known_etag:
+            return {'statusCode': 304, 'headers': response_headers}
+
+        print(f"Job status found: {body}")
+
         return {
             'statusCode': 200,
-            # Use the custom encoder to handle DynamoDB's numeric types
-            'body': json.dumps(item, cls=DecimalEncoder)
+            'headers': {**response_headers, 'Content-Type': 'application/json'},
+            'body': body
         }
-        
+
     except Exception as e:
         print(f"Error in Status-Checker Lambda: {e}")
         return {
             'statusCode': 500,
             'body': json.dumps({'error': 'An internal error occurred.'})
-        }
\ No newline at end of file
+        }
@@ -1,75 +1,273 @@
 import os
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import awswrangler as wr
 import boto3
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from summary import SummaryBuilder, find_column
+from partitioned import PartitionedGoldWriter
+from metrics import StageTimer, rollup_update
 
 # Initialize clients and environment variables
 SILVER_BUCKET_NAME = os.environ['SILVER_BUCKET_NAME']
 GOLD_BUCKET_NAME = os.environ['GOLD_BUCKET_NAME']
 DYNAMODB_TABLE_NAME = os.environ['DYNAMODB_TABLE_NAME']
+STITCH_READ_CONCURRENCY = int(os.environ.get('STITCH_READ_CONCURRENCY', 8))  # Silver files read in parallel
+TARGET_ROW_GROUP_SIZE = int(os.environ.get('TARGET_ROW_GROUP_SIZE', 100000))  # Rows per Gold row group
+GOLD_LAYOUT = os.environ.get('GOLD_LAYOUT', 'single')  # 'single' ({job_id}.parquet) or 'partitioned' ({job_id}/...)
+GOLD_PARTITION_COLUMNS = os.environ.get('GOLD_PARTITION_COLUMNS', 'sentiment_label,Department Name').split(',')
+GOLD_SORT_COLUMNS = os.environ.get('GOLD_SORT_COLUMNS', 'Age,Rating').split(',')  # Sorted within each row group
+GOLD_MAX_BUFFERED_ROWS = int(os.environ.get('GOLD_MAX_BUFFERED_ROWS', 200000))  # Across all open partitions
+GOLD_MAX_OPEN_FILES = int(os.environ.get('GOLD_MAX_OPEN_FILES', 32))  # Partition files (S3 uploads) open at once
+GOLD_DATA_PAGE_SIZE = int(os.environ.get('GOLD_DATA_PAGE_SIZE', 64 * 1024))  # Smaller pages make the page index selective
+# A STITCHING claim older than the function timeout belongs to a run that was killed (timeout, out of memory)
+STITCH_TIMEOUT_SECONDS = int(os.environ.get('STITCH_TIMEOUT_SECONDS', 900))
 
+s3_client = boto3.client('s3')
+# Honors the same endpoint override as boto3 so local S3 stand-ins work too
+s3_filesystem = pafs.S3FileSystem(
+    endpoint_override=os.environ.get('AWS_ENDPOINT_URL_S3') or os.environ.get('AWS_ENDPOINT_URL')
+)
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+timer = StageTimer('stitcher')
+
+def list_silver_files(job_id):
+    """Returns the keys of all partial Parquet files of a job, in chunk order."""
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=SILVER_BUCKET_NAME, Prefix=f"processed-batches/{job_id}/"):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []) if obj['Key'].endswith('.parquet'))
+    return sorted(keys)
+
+def get_total_batches(job_id):
+    """Returns the job's recorded number of batches, or None if it is not known yet."""
+    response = table.get_item(Key={'job_id': job_id}, ProjectionExpression='total_batches', ConsistentRead=True)
+    return response.get('Item', {}).get('total_batches')
+
+def read_silver_schema(key):
+    return pq.read_schema(f"{SILVER_BUCKET_NAME}/{key}", filesystem=s3_filesystem)
+
+def read_silver_table(key):
+    return pq.read_table(f"{SILVER_BUCKET_NAME}/{key}", filesystem=s3_filesystem)
+
+def read_in_order(executor, keys):
+    """Yields the Silver tables in order, keeping at most STITCH_READ_CONCURRENCY reads in flight."""
+    in_flight = deque()
+    for key in keys:
+        in_flight.append(executor.submit(read_silver_table, key))
+        if len(in_flight) >= STITCH_READ_CONCURRENCY:
+            # Only the time spent waiting for a read counts; reads overlap with the writes
+            with timer.stage('read'):
+                arrow_table = in_flight.popleft().result()
+            yield arrow_table
+    while in_flight:
+        with timer.stage('read'):
+            arrow_table = in_flight.popleft().result()
+        yield arrow_table
+
+def conform(arrow_table, schema):
+    """Aligns a partial file to the Gold schema: same column order and types, missing columns as nulls."""
+    columns = [
+        arrow_table.column(field.name).cast(field.type) if field.name in arrow_table.column_names
+        else pa.nulls(arrow_table.num_rows, type=field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+def write_single_file(tables, schema, job_id):
+    """
+    Writes the tables to one Gold Parquet file in row groups of exactly TARGET_ROW_GROUP_SIZE rows.
+    The file is written to the job's staging prefix and only copied to Gold once it is complete:
+    a failure mid-stream still closes the writer, which would otherwise publish a truncated
+    but valid file at the final key.
+    """
+    total_rows = 0
+    buffer, buffered_rows = [], 0
+    staging_key = f"staging/{job_id}/{job_id}.parquet"
+    with s3_filesystem.open_output_stream(f"{SILVER_BUCKET_NAME}/{staging_key}") as sink:
+        with pq.ParquetWriter(sink, schema, write_page_index=True) as writer:
+            for arrow_table in tables:
+                buffer.append(arrow_table)
+                buffered_rows += arrow_table.num_rows
+                while buffered_rows >= TARGET_ROW_GROUP_SIZE:
+                    pending = pa.concat_tables(buffer)
+                    with timer.stage('write'):
+                        writer.write_table(pending.slice(0, TARGET_ROW_GROUP_SIZE), row_group_size=TARGET_ROW_GROUP_SIZE)
+                    buffer = [pending.slice(TARGET_ROW_GROUP_SIZE)]
+                    buffered_rows -= TARGET_ROW_GROUP_SIZE
+                    total_rows += TARGET_ROW_GROUP_SIZE
+            if buffered_rows:
+                with timer.stage('write'):
+                    writer.write_table(pa.concat_tables(buffer), row_group_size=TARGET_ROW_GROUP_SIZE)
+                total_rows += buffered_rows
+    with timer.stage('publish'):
+        s3_client.copy({'Bucket': SILVER_BUCKET_NAME, 'Key': staging_key}, GOLD_BUCKET_NAME, f"{job_id}.parquet")
+    return total_rows
+
+def write_partitioned(tables, schema, job_id):
+    """Writes the tables as a hive-partitioned Gold dataset under {job_id}/ and returns its manifest."""
+    partition_columns = [find_column(schema, name) for name in GOLD_PARTITION_COLUMNS]
+    sort_columns = [find_column(schema, name) for name in GOLD_SORT_COLUMNS]
+    writer = PartitionedGoldWriter(
+        s3_filesystem, GOLD_BUCKET_NAME, job_id, schema,
+        partition_columns=[name for name in partition_columns if name],
+        sort_columns=[name for name in sort_columns if name],
+        row_group_size=TARGET_ROW_GROUP_SIZE,
+        max_buffered_rows=GOLD_MAX_BUFFERED_ROWS,
+        data_page_size=GOLD_DATA_PAGE_SIZE,
+        max_open_files=GOLD_MAX_OPEN_FILES
+    )
+    for arrow_table in tables:
+        with timer.stage('write'):
+            writer.write(arrow_table)
+    with timer.stage('write'):
+        return writer.close()
+
+def stream_stitch(keys, job_id):
+    """
+    Appends every Silver file to the Gold output without ever holding the whole job in
+    memory. Files are read a few at a time and written either to a single Parquet file or,
+    with GOLD_LAYOUT=partitioned, to a partitioned dataset plus its manifest. The
+    dashboard's aggregates are accumulated on the way through. With no files (an upload
+    without reviews) the output is empty.
+    Returns the number of rows written, the SummaryBuilder and the manifest (or None).
+    """
+    with ThreadPoolExecutor(max_workers=STITCH_READ_CONCURRENCY) as executor:
+        # 1. Build one consistent schema from the file footers (e.g. int Age in one file, float in another)
+        with timer.stage('schema'):
+            schemas = list(executor.map(read_silver_schema, keys))
+        schema = pa.unify_schemas(schemas, promote_options='permissive').remove_metadata() if schemas else pa.schema([])
+        summary = SummaryBuilder(schema)
+
+        def conformed_tables():
+            for arrow_table in read_in_order(executor, keys):
+                with timer.stage('conform'):
+                    arrow_table = conform(arrow_table, schema)
+                with timer.stage('summary'):
+                    summary.add(arrow_table)
+                yield arrow_table
+
+        # 2. Stream the files into the writer, one full row group at a time
+        if GOLD_LAYOUT == 'partitioned':
+            manifest = write_partitioned(conformed_tables(), schema, job_id)
+            return manifest['total_rows'], summary, manifest
+        total_rows = write_single_file(conformed_tables(), schema, job_id)
+    return total_rows, summary, None
 
 def handler(event, context):
     """
-    This function is triggered by API Gateway. It expects a job_id, merges all
-    partial Parquet files from the Silver bucket for that job, saves the final
-    result to the Gold bucket, and updates the final job status in DynamoDB.
+    This function is invoked asynchronously by the Processor (or Splitter) when the last
+    batch of a job completes, or through API Gateway as a manual fallback. It expects a
+    job_id, streams all partial Parquet files from the Silver bucket for that job into a
+    single Gold file, and updates the final job status in DynamoDB.
     """
     print(f"Stitcher handler started with event: {event}")
+    timer.reset()
 
-    # 1. Extract job_id from the API Gateway request body
+    # 1. Extract job_id from the direct invocation payload or the API Gateway request body
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = event if 'job_id' in event else json.loads(event.get('body') or '{}')
         job_id = body['job_id']
         print(f"Starting stitching process for job_id: {job_id}")
     except (KeyError, json.JSONDecodeError) as e:
         print(f"Error: 'job_id' not found or invalid JSON body. {e}")
         return {'statusCode': 400, 'body': json.dumps({'error': "Invalid request, 'job_id' is missing from the body."})}
 
-    # Define the S3 paths specific to this job
-    silver_path = f"s3://{SILVER_BUCKET_NAME}/processed-batches/{job_id}/"
-    gold_path = f"s3://{GOLD_BUCKET_NAME}/{job_id}.parquet"
-
+    # 2. Claim the job by moving it to "STITCHING"; a job that is already being stitched
+    #    or is complete is left alone, so duplicate triggers are no-ops. A claim older than
+    #    the function timeout was left by a run that died without reporting, so it is taken over.
+    now = int(time.time())
     try:
-        # 2. Update status in DynamoDB to "STITCHING"
         table.update_item(
             Key={'job_id': job_id},
-            UpdateExpression="SET #st = :s",
+            UpdateExpression="SET #st = :s, stitch_claimed_at = :now",
+            ConditionExpression=(
+                "#st IN (:in_progress, :queued, :failed) OR "
+                "(#st = :s AND (attribute_not_exists(stitch_claimed_at) OR stitch_claimed_at < :stale_before))"
+            ),
             ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':s': 'STITCHING'}
+            ExpressionAttributeValues={
+                ':s': 'STITCHING', ':in_progress': 'IN_PROGRESS',
+                ':queued': 'STITCH_QUEUED', ':failed': 'STITCHING_FAILED',
+                ':now': now, ':stale_before': now - STITCH_TIMEOUT_SECONDS
+            }
         )
-        
-        # 3. Read and merge all partial Parquet files from the job's folder
-        print(f"Reading all partial files from {silver_path}...")
-        df_final = wr.s3.read_parquet(path=silver_path)
-        print(f"Successfully loaded and merged {len(df_final)} total rows.")
-
-        # 4. Write the unified DataFrame to the Gold bucket
-        print(f"Writing final file to {gold_path}...")
-        wr.s3.to_parquet(df=df_final, path=gold_path, index=False)
-        print("Final file successfully saved to Gold layer.")
-        
-        # 5. Clean up the intermediate files from the Silver bucket
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Job {job_id} is already being stitched or is complete; nothing to do.")
+        return {'statusCode': 409, 'body': json.dumps({'error': f'Job {job_id} is already being stitched or is complete.'})}
+
+    # Define the S3 paths specific to this job
+    silver_path = f"s3://{SILVER_BUCKET_NAME}/processed-batches/{job_id}/"
+    staging_path = f"s3://{SILVER_BUCKET_NAME}/staging/{job_id}/"
+    gold_path = f"s3://{GOLD_BUCKET_NAME}/{job_id}.parquet"
+    summary_key = f"{job_id}.summary.json"
+    if GOLD_LAYOUT == 'partitioned':
+        gold_path = f"s3://{GOLD_BUCKET_NAME}/{job_id}/"
+
+    try:
+        # 3. Stream all partial Parquet files from the job's folder into the Gold file
+        with timer.stage('list'):
+            silver_keys = list_silver_files(job_id)
+        if not silver_keys and get_total_batches(job_id) != 0:
+            raise FileNotFoundError(f"No partial files found under {silver_path}")
+        print(f"Streaming {len(silver_keys)} partial files from {silver_path} into {gold_path}...")
+        if GOLD_LAYOUT == 'partitioned':
+            # Files from an earlier, failed attempt may belong to partitions this run will not write
+            with timer.stage('cleanup'):
+                wr.s3.delete_objects(path=gold_path)
+        total_rows, summary, manifest = stream_stitch(silver_keys, job_id)
+        print(f"Final output with {total_rows} rows successfully saved to Gold layer.")
+
+        with timer.stage('publish'):
+            if manifest:
+                s3_client.put_object(
+                    Bucket=GOLD_BUCKET_NAME,
+                    Key=f"{job_id}/_manifest.json",
+                    Body=json.dumps(manifest),
+                    ContentType='application/json'
+                )
+                print(f"Manifest of {len(manifest['files'])} partition files saved to {gold_path}_manifest.json.")
+
+            # Save the precomputed aggregates next to the Gold output for the dashboard
+            summary_data = summary.build(job_id)
+            summary_data['gold_layout'] = GOLD_LAYOUT
+            s3_client.put_object(
+                Bucket=GOLD_BUCKET_NAME,
+                Key=summary_key,
+                Body=json.dumps(summary_data),
+                ContentType='application/json'
+            )
+            print(f"Summary saved to s3://{GOLD_BUCKET_NAME}/{summary_key}.")
+
+        # 4. Clean up the intermediate files (and the staged claim-check chunks and Gold file) from the Silver bucket
         print(f"Cleaning up intermediate files from {silver_path}...")
-        wr.s3.delete_objects(path=silver_path)
+        with timer.stage('cleanup'):
+            wr.s3.delete_objects(path=silver_path)
+            wr.s3.delete_objects(path=staging_path)
         print("Cleanup complete.")
-        
-        # 6. Set the final status in DynamoDB to "COMPLETED"
+
+        # 5. Set the final status in DynamoDB to "COMPLETED" and add this function's stage totals
+        timer.count('rows', total_rows)
+        clauses, names, values = rollup_update(timer.seconds, 'stitcher')
         table.update_item(
             Key={'job_id': job_id},
-            UpdateExpression="SET #st = :s",
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':s': 'COMPLETED'}
+            UpdateExpression="SET " + ", ".join(["#st = :s"] + clauses),
+            ExpressionAttributeNames={'#st': 'status', **names},
+            ExpressionAttributeValues={':s': 'COMPLETED', **values}
         )
         print(f"Job {job_id} marked as COMPLETED.")
+        timer.emit(job_id=job_id)
 
         return {
             'statusCode': 200,
-            'body': json.dumps({'message': f'Job {job_id} completed successfully. Final file available at {gold_path}.'})
+            'body': json.dumps({'message': f'Job {job_id} completed successfully. Final output available at {gold_path}.'})
         }
-        
+
     except Exception as e:
         print(f"Error in Stitcher Lambda: {e}")
         # In case of an error, set the status to FAILED to allow for investigation
@@ -79,4 +277,5 @@ def handler(event, context):
             ExpressionAttributeNames={'#st': 'status'},
             ExpressionAttributeValues={':s': 'STITCHING_FAILED'}
         )
-        raise e
\ No newline at end of file
+        timer.emit(job_id=job_id, error=str(e))
+        raise e
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from urllib.parse import quote
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'  # Same null fallback as pyarrow's hive partitioning
+
+
+def partition_segment(column, value):
+    """Builds one 'column=value' path segment, URI-encoded so any category name is a valid key."""
+    return f"{column}={NULL_PARTITION if value is None else quote(str(value), safe='')}"
+
+
+class PartitionedGoldWriter:
+    """
+    Writes the Gold rows as a hive-partitioned dataset, with Parquet files under one
+    directory per partition (e.g. {job_id}/sentiment_label=POSITIVE/department_name=Tops/part-00000.parquet).
+    Directories are named after the columns as they are stored in Silver, i.e. after
+    awswrangler's column name sanitization, not after the canonical 'Department Name'.
+    The partition columns are encoded in the paths, not stored in the files.
+
+    Each partition buffers its rows until a full row group is ready. The buffer is sorted
+    on the sort columns before it is written, and files carry a page index, so readers can
+    skip row groups and pages using min/max statistics. When the buffers of all partitions
+    together exceed max_buffered_rows, the largest one is flushed early.
+
+    Every open file holds an S3 multipart upload that buffers up to one part, so at most
+    max_open_files are kept open: writing to another partition closes the least recently
+    used file, and that partition continues in a new part-NNNNN.parquet file. Memory is
+    therefore bounded by max_buffered_rows rows plus max_open_files upload parts, however
+    many partitions a job has; a job with more partitions just gets more, smaller files.
+
+    close() returns the manifest: every file with its partition values, row counts and
+    per-row-group min/max of the sort columns.
+    """
+
+    def __init__(self, filesystem, bucket, prefix, schema, partition_columns, sort_columns,
+                 row_group_size, max_buffered_rows, data_page_size, max_open_files=32):
+        self.filesystem = filesystem
+        self.bucket = bucket
+        self.prefix = prefix
+        self.partition_columns = partition_columns
+        self.file_schema = pa.schema([field for field in schema if field.name not in partition_columns])
+        self.sort_columns = [name for name in sort_columns if name in self.file_schema.names]
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.data_page_size = data_page_size
+        self.max_open_files = max(1, max_open_files)
+        self.partitions = {}
+        self.open_files = OrderedDict()  # Partition values -> open file, least recently used first
+        self.files = []  # Manifest entries of the closed files
+        self.buffered_rows = 0
+
+    def write(self, arrow_table):
+        """Routes one batch of Gold rows to the partitions it belongs to."""
+        keys = arrow_table.select(self.partition_columns)
+        for values in keys.group_by(self.partition_columns).aggregate([]).to_pylist():
+            mask = None
+            for column in self.partition_columns:
+                value = values[column]
+                condition = pc.is_null(keys[column]) if value is None else pc.equal(keys[column], value)
+                mask = condition if mask is None else pc.and_(mask, condition)
+            rows = arrow_table.filter(mask).select(self.file_schema.names)
+            partition = self._partition(tuple(values[column] for column in self.partition_columns))
+            partition['buffer'].append(rows)
+            partition['buffered_rows'] += rows.num_rows
+            self.buffered_rows += rows.num_rows
+            while partition['buffered_rows'] >= self.row_group_size:
+                self._flush(partition, self.row_group_size)
+
+        # Bound the memory held across all partitions
+        while self.buffered_rows > self.max_buffered_rows:
+            largest = max(self.partitions.values(), key=lambda partition: partition['buffered_rows'])
+            self._flush(largest, largest['buffered_rows'])
+
+    def _partition(self, values):
+        if values not in self.partitions:
+            self.partitions[values] = {
+                'values': values,
+                'directory': '/'.join(
+                    partition_segment(column, value) for column, value in zip(self.partition_columns, values)
+                ),
+                'file_count': 0,
+                'buffer': [],
+                'buffered_rows': 0
+            }
+        return self.partitions[values]
+
+    def _file(self, partition):
+        """Returns the partition's open file, opening a new part (and closing the least recently used file) if needed."""
+        values = partition['values']
+        if values in self.open_files:
+            self.open_files.move_to_end(values)
+            return self.open_files[values]
+        if len(self.open_files) >= self.max_open_files:
+            self._close_file(*self.open_files.popitem(last=False))
+        key = f"{self.prefix}/{partition['directory']}/part-{partition['file_count']:05d}.parquet"
+        partition['file_count'] += 1
+        sink = self.filesystem.open_output_stream(f"{self.bucket}/{key}")
+        self.open_files[values] = {
+            'key': key,
+            'sink': sink,
+            'writer': pq.ParquetWriter(sink, self.file_schema, write_page_index=True, data_page_size=self.data_page_size),
+            'row_groups': []
+        }
+        return self.open_files[values]
+
+    def _close_file(self, values, file):
+        file['writer'].close()
+        file['sink'].close()
+        self.files.append({
+            'key': file['key'],
+            'partition': dict(zip(self.partition_columns, values)),
+            'num_rows': sum(row_group['num_rows'] for row_group in file['row_groups']),
+            'row_groups': file['row_groups']
+        })
+
+    def _flush(self, partition, rows):
+        """Writes the first `rows` buffered rows of a partition as one sorted row group."""
+        pending = pa.concat_tables(partition['buffer'])
+        row_group = pending.slice(0, rows)
+        if self.sort_columns:
+            row_group = row_group.sort_by([(name, 'ascending') for name in self.sort_columns])
+        file = self._file(partition)
+        file['writer'].write_table(row_group, row_group_size=rows)
+        file['row_groups'].append(self._row_group_stats(row_group))
+        partition['buffer'] = [pending.slice(rows)]
+        partition['buffered_rows'] -= rows
+        self.buffered_rows -= rows
+
+    def _row_group_stats(self, row_group):
+        statistics = {}
+        for name in self.sort_columns:
+            min_max = pc.min_max(row_group[name])
+            statistics[name] = {'min': min_max['min'].as_py(), 'max': min_max['max'].as_py()}
+        return {'num_rows': row_group.num_rows, 'statistics': statistics}
+
+    def close(self):
+        """Flushes every partition, closes the files and returns the manifest."""
+        for partition in self.partitions.values():
+            if partition['buffered_rows']:
+                self._flush(partition, partition['buffered_rows'])
+        while self.open_files:
+            self._close_file(*self.open_files.popitem(last=False))
+        files = self.files
+        return {
+            'layout': 'partitioned',
+            'prefix': self.prefix,
+            'partition_columns': self.partition_columns,
+            'sort_columns': self.sort_columns,
+            'total_rows': sum(file['num_rows'] for file in files),
+            'files': sorted(files, key=lambda file: file['key'])
+        }
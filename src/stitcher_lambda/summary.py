@@ -0,0 +1,144 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TOP_PRODUCTS = 50  # Products listed in the per-'Clothing ID' breakdown
+AGE_BUCKET_WIDTH = 10
+
+
+def find_column(schema, name):
+    """Returns the Gold name of a canonical column ('Department Name' may be stored as 'Department_Name' or 'department_name')."""
+    for candidate in (name, name.replace(' ', '_'), name.replace(' ', '_').lower()):
+        if candidate in schema.names:
+            return candidate
+    return None
+
+
+class SummaryBuilder:
+    """
+    Accumulates the aggregates the dashboard needs while the Stitcher streams the job's
+    rows, so the results page never has to load the full Gold file. Memory grows with the
+    number of distinct keys (labels, departments, ages, products), never with the rows.
+
+    The core of the summary is a small cube of (sentiment, department, age) cells holding
+    the row count and rating sum, from which KPIs and charts can be computed exactly for
+    any combination of the dashboard's filters.
+    """
+
+    def __init__(self, schema):
+        self.sentiment = find_column(schema, 'sentiment_label')
+        self.department = find_column(schema, 'Department Name')
+        self.age = find_column(schema, 'Age')
+        self.rating = find_column(schema, 'Rating')
+        self.product = find_column(schema, 'Clothing ID')
+        self.topic = find_column(schema, 'topic')
+        self.total_rows = 0
+        self.cube = {}
+        self.ratings = {}
+        self.products = {}
+        self.topics = {}
+
+    def _column(self, arrow_table, name):
+        if name is None:
+            return pa.nulls(arrow_table.num_rows)
+        return arrow_table.column(name)
+
+    def add(self, arrow_table):
+        """Folds one batch of Gold rows into the running aggregates."""
+        self.total_rows += arrow_table.num_rows
+        rating = self._column(arrow_table, self.rating).cast(pa.float64())
+        # Ages may arrive as floats when a chunk had missing values
+        age = pc.floor(self._column(arrow_table, self.age).cast(pa.float64())).cast(pa.int64())
+
+        keys = pa.table({
+            'sentiment': self._column(arrow_table, self.sentiment).cast(pa.string()),
+            'department': self._column(arrow_table, self.department).cast(pa.string()),
+            'age': age,
+            'rating': rating,
+            'product': self._column(arrow_table, self.product).cast(pa.string()),
+            'topic': self._column(arrow_table, self.topic).cast(pa.string()),
+            'one': pa.repeat(1, arrow_table.num_rows)
+        })
+
+        cube = keys.group_by(['sentiment', 'department', 'age']).aggregate(
+            [('one', 'sum'), ('rating', 'sum'), ('rating', 'count')]
+        )
+        for row in cube.to_pylist():
+            cell = self.cube.setdefault((row['sentiment'], row['department'], row['age']), [0, 0.0, 0])
+            cell[0] += row['one_sum']
+            cell[1] += row['rating_sum'] or 0.0
+            cell[2] += row['rating_count']
+
+        for row in keys.group_by(['rating', 'sentiment']).aggregate([('one', 'sum')]).to_pylist():
+            key = (row['rating'], row['sentiment'])
+            self.ratings[key] = self.ratings.get(key, 0) + row['one_sum']
+
+        for column, cells in (('product', self.products), ('topic', self.topics)):
+            if getattr(self, column) is None:
+                continue
+            groups = keys.group_by([column, 'sentiment']).aggregate(
+                [('one', 'sum'), ('rating', 'sum'), ('rating', 'count')]
+            )
+            for row in groups.to_pylist():
+                cell = cells.setdefault((row[column], row['sentiment']), [0, 0.0, 0])
+                cell[0] += row['one_sum']
+                cell[1] += row['rating_sum'] or 0.0
+                cell[2] += row['rating_count']
+
+    def _breakdown(self, cells, key_name, limit=None):
+        """Groups (key, sentiment) cells into one row per key with counts, positives and mean rating."""
+        groups = {}
+        for (key, sentiment), (count, rating_sum, rating_count) in cells.items():
+            group = groups.setdefault(key, {key_name: key, 'count': 0, 'positive': 0, 'rating_sum': 0.0, 'rating_count': 0})
+            group['count'] += count
+            group['positive'] += count if sentiment == 'POSITIVE' else 0
+            group['rating_sum'] += rating_sum
+            group['rating_count'] += rating_count
+        rows = sorted(groups.values(), key=lambda group: group['count'], reverse=True)[:limit]
+        for row in rows:
+            rating_count = row.pop('rating_count')
+            rating_sum = row.pop('rating_sum')
+            row['rating_mean'] = rating_sum / rating_count if rating_count else None
+        return rows
+
+    def build(self, job_id):
+        """Returns the JSON-serializable summary artifact."""
+        sentiment_counts, age_buckets = {}, {}
+        for (sentiment, _, age), (count, _, _) in self.cube.items():
+            sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + count
+            if age is not None:
+                bucket = age // AGE_BUCKET_WIDTH * AGE_BUCKET_WIDTH
+                age_buckets[bucket] = age_buckets.get(bucket, 0) + count
+
+        rating_counts = {}
+        for (rating, _), count in self.ratings.items():
+            if rating is not None:
+                rating_counts[rating] = rating_counts.get(rating, 0) + count
+
+        ages = [age for _, _, age in self.cube if age is not None]
+        department_cells = {}
+        for (sentiment, department, _), cell in self.cube.items():
+            merged = department_cells.setdefault((department, sentiment), [0, 0.0, 0])
+            for i, value in enumerate(cell):
+                merged[i] += value
+
+        return {
+            'job_id': job_id,
+            'total_rows': self.total_rows,
+            'columns': {'department': self.department, 'age': self.age, 'rating': self.rating, 'product': self.product,
+                        'topic': self.topic},
+            'sentiment_counts': sentiment_counts,
+            'rating_counts': [{'rating': rating, 'count': count} for rating, count in sorted(rating_counts.items())],
+            'age_range': [min(ages), max(ages)] if ages else None,
+            'age_histogram': [
+                {'bucket_start': bucket, 'bucket_end': bucket + AGE_BUCKET_WIDTH - 1, 'count': count}
+                for bucket, count in sorted(age_buckets.items())
+            ],
+            'by_department': self._breakdown(department_cells, 'department'),
+            'top_products': self._breakdown(self.products, 'product', limit=TOP_PRODUCTS),
+            'by_topic': self._breakdown(self.topics, 'topic'),
+            'cube': [
+                {'sentiment_label': sentiment, 'department': department, 'age': age,
+                 'count': count, 'rating_sum': rating_sum, 'rating_count': rating_count}
+                for (sentiment, department, age), (count, rating_sum, rating_count) in self.cube.items()
+            ]
+        }
@@ -36,6 +36,12 @@ resource "aws_apigatewayv2_route" "get_status_route" {
   target    = "integrations/${aws_apigatewayv2_integration.status_checker_integration.id}"
 }
 
+resource "aws_apigatewayv2_route" "get_statuses_route" {
+  api_id    = aws_apigatewayv2_api.main_api.id
+  route_key = "GET /status" # e.g., GET /status?job_ids=abc-123,def-456 (one BatchGetItem)
+  target    = "integrations/${aws_apigatewayv2_integration.status_checker_integration.id}"
+}
+
 resource "aws_apigatewayv2_route" "start_stitcher_route" {
   api_id    = aws_apigatewayv2_api.main_api.id
   route_key = "POST /stitch" # POST request to start the stitching process
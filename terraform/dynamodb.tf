@@ -9,4 +9,23 @@ resource "aws_dynamodb_table" "jobs_status_table" {
     name = "job_id"
     type = "S" # S for String
   }
-}
\ No newline at end of file
+}
+
+# --- DynamoDB Table for the Shared Sentiment Cache ---
+# Content-addressed store of model predictions, shared by all Processor containers so
+# re-uploaded reviews skip inference. Entries expire automatically through TTL.
+resource "aws_dynamodb_table" "sentiment_cache_table" {
+  name         = "reviewlens-sentiment-cache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S" # SHA-256 of the model id and the normalized review text
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
@@ -32,8 +32,10 @@ resource "aws_iam_policy" "splitter_policy" {
     Version   = "2012-10-17",
     Statement = [
       { Action = ["s3:GetObject"], Effect = "Allow", Resource = ["${aws_s3_bucket.bronze_bucket.arn}/*"] },
+      { Action = ["s3:PutObject"], Effect = "Allow", Resource = ["${aws_s3_bucket.silver_bucket.arn}/staging/*"] },
       { Action = ["sqs:SendMessage"], Effect = "Allow", Resource = [aws_sqs_queue.reviews_queue.arn] },
-      { Action = ["dynamodb:PutItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] }
+      { Action = ["dynamodb:PutItem", "dynamodb:UpdateItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] },
+      { Action = ["lambda:InvokeFunction"], Effect = "Allow", Resource = [aws_lambda_function.stitcher_lambda.arn] }
     ]
   })
 }
@@ -58,7 +60,10 @@ resource "aws_iam_policy" "processor_policy" {
     Statement = [
       { Action = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"], Effect = "Allow", Resource = [aws_sqs_queue.reviews_queue.arn] },
       { Action = ["s3:PutObject"], Effect = "Allow", Resource = ["${aws_s3_bucket.silver_bucket.arn}/*"] },
-      { Action = ["dynamodb:UpdateItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] }
+      { Action = ["s3:GetObject"], Effect = "Allow", Resource = ["${aws_s3_bucket.silver_bucket.arn}/staging/*", "${aws_s3_bucket.bronze_bucket.arn}/*"] },
+      { Action = ["dynamodb:GetItem", "dynamodb:UpdateItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] },
+      { Action = ["dynamodb:BatchGetItem", "dynamodb:BatchWriteItem"], Effect = "Allow", Resource = [aws_dynamodb_table.sentiment_cache_table.arn] },
+      { Action = ["lambda:InvokeFunction"], Effect = "Allow", Resource = [aws_lambda_function.stitcher_lambda.arn] }
     ]
   })
 }
@@ -81,9 +86,9 @@ resource "aws_iam_policy" "stitcher_policy" {
   policy = jsonencode({
     Version   = "2012-10-17",
     Statement = [
-      { Action = ["s3:GetObject", "s3:ListBucket", "s3:DeleteObject"], Effect = "Allow", Resource = [aws_s3_bucket.silver_bucket.arn, "${aws_s3_bucket.silver_bucket.arn}/*"] },
-      { Action = ["s3:PutObject"], Effect = "Allow", Resource = ["${aws_s3_bucket.gold_bucket.arn}/*"] },
-      { Action = ["dynamodb:UpdateItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] }
+      { Action = ["s3:GetObject", "s3:PutObject", "s3:ListBucket", "s3:DeleteObject"], Effect = "Allow", Resource = [aws_s3_bucket.silver_bucket.arn, "${aws_s3_bucket.silver_bucket.arn}/*"] },
+      { Action = ["s3:PutObject", "s3:ListBucket", "s3:DeleteObject"], Effect = "Allow", Resource = [aws_s3_bucket.gold_bucket.arn, "${aws_s3_bucket.gold_bucket.arn}/*"] },
+      { Action = ["dynamodb:GetItem", "dynamodb:UpdateItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] }
     ]
   })
 }
@@ -106,7 +111,7 @@ resource "aws_iam_policy" "status_checker_policy" {
   policy = jsonencode({
     Version   = "2012-10-17",
     Statement = [
-      { Action = ["dynamodb:GetItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] }
+      { Action = ["dynamodb:GetItem", "dynamodb:BatchGetItem"], Effect = "Allow", Resource = [aws_dynamodb_table.jobs_status_table.arn] }
     ]
   })
 }
@@ -165,8 +170,13 @@ resource "aws_lambda_function" "splitter_lambda" {
   memory_size      = 512
   environment {
     variables = {
-      SQS_QUEUE_URL       = aws_sqs_queue.reviews_queue.url
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.jobs_status_table.name
+      SQS_QUEUE_URL          = aws_sqs_queue.reviews_queue.url
+      DYNAMODB_TABLE_NAME    = aws_dynamodb_table.jobs_status_table.name
+      PAYLOAD_MODE           = "claim_check" # Chunks go to S3 as Arrow files; SQS only carries pointers.
+      SPLIT_MODE             = "stream"      # "ranges" fans out row-aligned byte ranges read by the Processors.
+      CHUNK_TOKEN_BUDGET     = 200000        # Estimated model tokens per streamed chunk (250-8000 rows); 0 = fixed BATCH_SIZE rows.
+      STAGING_BUCKET_NAME    = aws_s3_bucket.silver_bucket.bucket
+      STITCHER_FUNCTION_NAME = aws_lambda_function.stitcher_lambda.function_name
     }
   }
 }
@@ -184,9 +194,16 @@ resource "aws_lambda_function" "processor_lambda" {
   }
   environment {
     variables = {
-      HF_HOME             = "/tmp/huggingface_cache"
-      SILVER_BUCKET_NAME  = aws_s3_bucket.silver_bucket.bucket
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.jobs_status_table.name
+      HF_HOME                    = "/tmp/huggingface_cache"
+      SILVER_BUCKET_NAME         = aws_s3_bucket.silver_bucket.bucket
+      DYNAMODB_TABLE_NAME        = aws_dynamodb_table.jobs_status_table.name
+      INFERENCE_BACKEND          = "onnx"     # int8 ONNX Runtime copy baked into the image; "torch" for the original model.
+      INFERENCE_BATCH_SIZE       = 32         # Rows per padded forward pass in the batched engine.
+      INFERENCE_WORKERS          = "auto"     # One forked inference worker per vCPU (3008 MB = 2 vCPUs).
+      LONG_REVIEW_MODE           = "truncate" # "chunk" scores over-length reviews as pooled token windows.
+      TOPIC_LABELS               = "price,quality,shipping,customer service,fit,fabric" # Empty disables topic tagging.
+      SENTIMENT_CACHE_TABLE_NAME = aws_dynamodb_table.sentiment_cache_table.name
+      STITCHER_FUNCTION_NAME     = aws_lambda_function.stitcher_lambda.function_name
     }
   }
 }
@@ -197,13 +214,16 @@ resource "aws_lambda_function" "stitcher_lambda" {
   role          = aws_iam_role.stitcher_lambda_role.arn
   package_type  = "Image"
   image_uri     = "${aws_ecr_repository.stitcher_lambda_repo.repository_url}:latest"
-  timeout       = 300
+  timeout       = 900 # Runs asynchronously now, no longer bound by the API Gateway timeout.
   memory_size   = 2048
   environment {
     variables = {
-      SILVER_BUCKET_NAME  = aws_s3_bucket.silver_bucket.bucket
-      GOLD_BUCKET_NAME    = aws_s3_bucket.gold_bucket.bucket
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.jobs_status_table.name
+      SILVER_BUCKET_NAME     = aws_s3_bucket.silver_bucket.bucket
+      GOLD_BUCKET_NAME       = aws_s3_bucket.gold_bucket.bucket
+      DYNAMODB_TABLE_NAME    = aws_dynamodb_table.jobs_status_table.name
+      TARGET_ROW_GROUP_SIZE  = 100000 # Rows per row group in the streamed Gold file.
+      GOLD_LAYOUT            = "single" # "partitioned" writes {job_id}/sentiment_label=.../department_name=.../ plus a manifest.
+      STITCH_TIMEOUT_SECONDS = 900 # Keep equal to the timeout above; older STITCHING claims are taken over.
     }
   }
 }
@@ -222,7 +242,10 @@ resource "aws_lambda_function" "status_checker_lambda" {
   memory_size      = 128
   environment {
     variables = {
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.jobs_status_table.name
+      DYNAMODB_TABLE_NAME          = aws_dynamodb_table.jobs_status_table.name
+      MAX_WAIT_SECONDS             = 20 # Long-poll cap, kept below the 30 s API Gateway integration timeout.
+      STITCH_TIMEOUT_SECONDS       = aws_lambda_function.stitcher_lambda.timeout # Older STITCHING claims are reported as stale.
+      STITCH_QUEUE_TIMEOUT_SECONDS = 300 # Older STITCH_QUEUED jobs whose Stitcher never started are reported as stale.
     }
   }
 }
@@ -238,6 +261,17 @@ resource "aws_s3_bucket_notification" "bronze_to_splitter_notification" {
     events              = ["s3:ObjectCreated:*"]
     filter_suffix       = ".csv"
   }
+  # The dashboard uploads compressed CSVs; the Splitter decompresses them while streaming
+  lambda_function {
+    lambda_function_arn = aws_lambda_function.splitter_lambda.arn
+    events              = ["s3:ObjectCreated:*"]
+    filter_suffix       = ".csv.gz"
+  }
+  lambda_function {
+    lambda_function_arn = aws_lambda_function.splitter_lambda.arn
+    events              = ["s3:ObjectCreated:*"]
+    filter_suffix       = ".csv.zst"
+  }
   depends_on = [aws_lambda_permission.allow_s3_to_invoke_splitter]
 }
 resource "aws_lambda_permission" "allow_s3_to_invoke_splitter" {
@@ -250,9 +284,11 @@ resource "aws_lambda_permission" "allow_s3_to_invoke_splitter" {
 
 # Trigger #2: SQS -> Processor Lambda
 resource "aws_lambda_event_source_mapping" "sqs_to_processor_trigger" {
-  event_source_arn = aws_sqs_queue.reviews_queue.arn
-  function_name    = aws_lambda_function.processor_lambda.arn
-  batch_size       = 1
+  event_source_arn                   = aws_sqs_queue.reviews_queue.arn
+  function_name                      = aws_lambda_function.processor_lambda.arn
+  batch_size                         = 10
+  maximum_batching_window_in_seconds = 10                           # Wait briefly to fill larger batches.
+  function_response_types            = ["ReportBatchItemFailures"] # Only failed messages are redelivered.
 }
 
 # Trigger #3: API Gateway -> Status-Checker Lambda
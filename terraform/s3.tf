@@ -38,6 +38,20 @@ resource "aws_s3_bucket_lifecycle_configuration" "silver_bucket_lifecycle" {
       days = 7
     }
   }
+
+  # Claim-check chunks staged by the Splitter are only needed until they are processed.
+  rule {
+    id     = "cleanup-staged-chunks"
+    status = "Enabled"
+
+    filter {
+      prefix = "staging/"
+    }
+
+    expiration {
+      days = 7
+    }
+  }
 }
 
 